@@ -0,0 +1,250 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+# Rendering is measured without a window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+
+from Engine import *
+from Lexicon import *
+
+# Metric suffixes telling whether lower or higher values are better, other metrics are informational
+_HIGHER_IS_BETTER = ("_per_s",)
+_LOWER_IS_BETTER = ("_s", "_bytes")
+
+
+def _median_time(function: Callable[[], object], repeat: int, number: int = 1) -> float:
+    """ Median over 'repeat' runs of the seconds per call of function, called 'number' times per run. """
+    _times = []
+    for _ in range(repeat):
+        _start = time.perf_counter()
+        for _ in range(number):
+            function()
+        _times.append((time.perf_counter() - _start) / number)
+    return float(np.median(_times))
+
+
+def benchmark_positions(dictionary: DAWG, seed: int, nr_positions: int) -> List[Tuple[BoardState, List[str]]]:
+    """ (board, rack) of the turns of a seeded greedy game, used as benchmark inputs. """
+    _game = Game(dictionary=dictionary, seed=seed)
+    _positions = []
+    while not _game.is_over and len(_positions) < nr_positions:
+        _positions.append((_game.board.copy(), list(_game.current_rack.letters)))
+        _moves = _game.legal_moves()
+        if _moves:
+            _game.play_move(move=_moves[int(np.argmax(_game.score_moves(moves=_moves)))])
+        else:
+            _game.pass_turn()
+    return _positions
+
+
+def bench_lexicon(source_path: str, repeat: int) -> Dict[str, float]:
+    _words = sorted(read_wordlist(path=source_path))
+    _start = time.perf_counter()
+    _dawg = DAWG()
+    _dawg.add_strings(strings=_words)
+    _build_s = time.perf_counter() - _start
+
+    tracemalloc.start()
+    _dawg = DAWG()
+    _dawg.add_strings(strings=_words)
+    _, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    _load_s = _median_time(lambda: get_lexicon(source_path=source_path), repeat=repeat)
+    return {"build_s": _build_s,
+            "build_peak_bytes": _peak,
+            "image_bytes": len(_dawg.to_bytes()),
+            "nr_nodes": _dawg.nr_nodes,
+            "cache_load_s": _load_s}
+
+
+def bench_holds(dictionary: DAWG, source_path: str, repeat: int) -> Dict[str, float]:
+    _rng = np.random.default_rng(0)
+    _words = read_wordlist(path=source_path)
+    _queries = [_words[_i] for _i in _rng.integers(len(_words), size=5000)]
+    # Half of the queries are scrambled, most of which are not words
+    _queries += ["".join(_rng.permutation(list(_word))) for _word in _queries]
+
+    def run():
+        for _word in _queries:
+            dictionary.holds(word=_word)
+
+    return {"holds_per_s": len(_queries) / _median_time(run, repeat=repeat)}
+
+
+def bench_words_in_dictionary(dictionary: DAWG, racks: List[List[str]], repeat: int) -> Dict[str, float]:
+    from Util import words_in_dictionary
+    # First call builds the anagram index
+    _start = time.perf_counter()
+    words_in_dictionary(_string="".join(racks[0]), dictionary=dictionary)
+    _first_s = time.perf_counter() - _start
+
+    def run():
+        for _rack in racks:
+            words_in_dictionary(_string="".join(_rack), dictionary=dictionary)
+
+    return {"index_build_s": _first_s,
+            "per_rack_s": _median_time(run, repeat=repeat) / len(racks)}
+
+
+def bench_move_generation(dictionary: DAWG, positions: List[Tuple[BoardState, List[str]]],
+                          repeat: int) -> Dict[str, float]:
+    _generator = MoveGenerator(dictionary=dictionary)
+    _moves = []
+
+    def generate():
+        _moves.clear()
+        for _board, _rack in positions:
+            _moves.append(_generator.generate(letters=_board.letters, rack=_rack,
+                                              cross_checks=_board.cross_checks))
+
+    def score():
+        for (_board, _), _position_moves in zip(positions, _moves):
+            score_moves(letters=_board.letters, blanks=_board.blanks, moves=_position_moves)
+
+    _generate_s = _median_time(generate, repeat=repeat)
+    _nr_moves = sum([len(_position_moves) for _position_moves in _moves])
+    return {"generate_per_rack_s": _generate_s / len(positions),
+            "moves_per_rack": _nr_moves / len(positions),
+            "score_per_move_s": _median_time(score, repeat=repeat) / _nr_moves}
+
+
+def bench_submit(dictionary: DAWG, repeat: int) -> Dict[str, float]:
+    from GameObjects import Board, Play, PygameText
+    _game = Game(dictionary=dictionary, seed=0)
+    _moves = _game.legal_moves()
+    _move = _moves[int(np.argmax(_game.score_moves(moves=_moves)))]
+    _board = Board(nr_rows=15, nr_cols=15, board_size=(600, 600), state=BoardState())
+    _play = Play()
+    for _row, _col, _letter in _move.tiles:
+        _cell = _board.grid[_row][_col]
+        _cell.set_content(content=PygameText(text=_letter, text_size=_cell.text_size, text_color=(255, 255, 255),
+                                             center_x=_cell.button.rect.centerx,
+                                             center_y=_cell.button.rect.centery))
+    _coordinates = [(_row, _col) for _row, _col, _ in _move.tiles]
+    _times = []
+    for _ in range(repeat * 20):
+        _play.board_coordinates = list(_coordinates)
+        _start = time.perf_counter()
+        _result = _play.submit(board=_board, dictionary=dictionary)
+        _times.append(time.perf_counter() - _start)
+        assert _result.valid, _result.reason
+        _board.state.remove(coordinates=_coordinates, dictionary=dictionary)
+    return {"submit_s": float(np.median(_times))}
+
+
+def bench_render(repeat: int) -> Dict[str, float]:
+    import pygame
+    from ScrabbleEnvironment import Scrabble
+    pygame.init()
+    _scrabble = Scrabble(seed=0, display_gameplay=True)
+    _scrabble.fps = 0  # No frame rate cap
+    _start = time.perf_counter()
+    _scrabble._render()
+    _full_s = time.perf_counter() - _start
+    _idle_s = _median_time(_scrabble._render, repeat=repeat, number=50)
+    _cells = [_scrabble.board.grid[_row][_col].button for _row in range(15) for _col in range(15)]
+
+    def hover():
+        # Moving the highlight across the board, two cells change per frame
+        for _previous, _button in zip(_cells, _cells[1:]):
+            _previous.set_highlighted(highlighted=False)
+            _button.set_highlighted(highlighted=True)
+            _scrabble._render()
+        _cells[-1].set_highlighted(highlighted=False)
+
+    _hover_s = _median_time(hover, repeat=repeat) / (len(_cells) - 1)
+    pygame.quit()
+    return {"full_frame_s": _full_s, "idle_frame_s": _idle_s, "hover_frame_s": _hover_s}
+
+
+BENCHMARKS = ["lexicon", "holds", "words_in_dictionary", "move_generation", "submit", "render"]
+
+
+def run_benchmarks(names: List[str], repeat: int = 5, source_path: str = None) -> Dict[str, Dict[str, float]]:
+    """ Runs the named benchmarks (see BENCHMARKS) and returns their metrics by benchmark. """
+    if source_path is None:
+        source_path = WORDLIST_DIR + os.listdir(WORDLIST_DIR)[0]
+    _dictionary = get_lexicon(source_path=source_path)
+    _positions = benchmark_positions(dictionary=_dictionary, seed=0, nr_positions=20) \
+        if {"words_in_dictionary", "move_generation"} & set(names) else []
+    _runs = {"lexicon": lambda: bench_lexicon(source_path=source_path, repeat=repeat),
+             "holds": lambda: bench_holds(dictionary=_dictionary, source_path=source_path, repeat=repeat),
+             "words_in_dictionary": lambda: bench_words_in_dictionary(
+                 dictionary=_dictionary, racks=[_rack for _, _rack in _positions], repeat=repeat),
+             "move_generation": lambda: bench_move_generation(dictionary=_dictionary, positions=_positions,
+                                                              repeat=repeat),
+             "submit": lambda: bench_submit(dictionary=_dictionary, repeat=repeat),
+             "render": lambda: bench_render(repeat=repeat)}
+    _results = {}
+    for _name in names:
+        _results[_name] = _runs[_name]()
+        print(_name, json.dumps(_results[_name]), flush=True)
+    return _results
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[str]:
+    """ Prints the change of every metric against the baseline and returns the regressed
+        metrics, those more than 'tolerance' (relative) worse than the baseline. """
+    _regressions = []
+    for _name, _metrics in results.items():
+        for _metric, _value in _metrics.items():
+            _old = baseline.get(_name, {}).get(_metric)
+            if not _old:
+                continue
+            _ratio = _value / _old
+            if _metric.endswith(_HIGHER_IS_BETTER):
+                _worse = _ratio < 1 - tolerance
+            else:
+                _worse = _metric.endswith(_LOWER_IS_BETTER) and _ratio > 1 + tolerance
+            print(f'{_name}.{_metric}: {_old:.6g} -> {_value:.6g} ({_ratio:.2f}x){"  REGRESSION" if _worse else ""}')
+            if _worse:
+                _regressions.append(f'{_name}.{_metric}')
+    return _regressions
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description="Runs the benchmark suite and saves or compares baselines.")
+    _parser.add_argument("benchmarks", nargs="*", default=BENCHMARKS,
+                         help=f'Benchmarks to run, all by default, from {BENCHMARKS}.')
+    _parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement, the median is reported.")
+    _parser.add_argument("--output", help="JSON file to save the results to, e.g. as a baseline.")
+    _parser.add_argument("--compare", help="Baseline JSON file to compare the results with.")
+    _parser.add_argument("--tolerance", type=float, default=0.1,
+                         help="Relative change counted as a regression when comparing.")
+    _args = _parser.parse_args()
+
+    for _name in _args.benchmarks:
+        assert _name in BENCHMARKS, f'Unknown benchmark: {_name}, choose from {BENCHMARKS}.'
+    _results = run_benchmarks(names=_args.benchmarks, repeat=_args.repeat)
+    if _args.output:
+        with open(_args.output, "w") as _file:
+            json.dump({"commit": _commit(),
+                       "python": sys.version.split()[0],
+                       "platform": platform.platform(),
+                       "results": _results}, _file, indent=2)
+    if _args.compare:
+        with open(_args.compare, "r") as _file:
+            _baseline = json.load(_file)["results"]
+        _regressions = compare(results=_results, baseline=_baseline, tolerance=_args.tolerance)
+        if _regressions:
+            print("Regressed:", ", ".join(_regressions))
+            sys.exit(1)
@@ -0,0 +1,187 @@
+import argparse
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from Engine import *
+from Lexicon import *
+
+_EXACT, _LOWER, _UPPER = 0, 1, 2
+
+
+class EndgameResult(NamedTuple):
+    """ Outcome of an endgame search, values are points of the player in turn minus points of the opponent. """
+    moves: List[Optional[Move]]  # Principal variation, None being a pass
+    value: float  # Spread gained until the end of the game along moves
+    depth: int  # Deepest fully searched number of plies
+    # True if the search reached the end of the game everywhere, i.e. moves are optimal and value is exact.
+    # Otherwise the result is only an estimate: lines cut at depth are valued as if the game ended there
+    complete: bool
+    nr_nodes: int
+    duration: float  # Seconds
+
+
+class _Budget(Exception):
+    """ Raised inside the search when the time or node budget is used up. """
+
+
+def _rack_value(rack: List[str]) -> int:
+    return sum([TILE_POINTS[_letter] for _letter in rack])
+
+
+class EndgameSolver:
+    """ Searches endgames (empty bag, both racks known) with negamax alpha-beta and iterative
+    deepening. Moves are ordered with the best move found at the previous depth first, then
+    moves going out, then by score; positions are cached in a transposition table keyed by a
+    Zobrist hash (see Zobrist) of the board, both racks, the player in turn and the number of
+    scoreless turns. Positions at the depth limit are valued as if the game ended there without
+    anyone going out. """
+
+    def __init__(self, dictionary: DAWG) -> None:
+        self.dictionary = dictionary
+        self.generator = MoveGenerator(dictionary=dictionary)
+        # Hash -> (depth, value, bound flag, best move, best line, whether the depth limit was hit)
+        self._table: Dict[int, Tuple[int, float, int, Optional[Move], List[Optional[Move]], bool]] = {}
+
+    def _hash(self, player: int, nr_scoreless: int) -> int:
+        # Board and racks keep their hashes up to date as moves are placed and taken back
+        return self._board.hash ^ self._racks[0].hash ^ self._racks[1].hash ^ PLAYER_KEYS[player] ^ \
+            SCORELESS_KEYS[nr_scoreless]
+
+    def _place(self, player: int, move: Move) -> None:
+        self._board.place(tiles=list(move.tiles), dictionary=self.dictionary)
+        self._racks[player].remove(letters=[_letter for _, _, _letter in move.tiles])
+
+    def _take_back(self, player: int, move: Move) -> None:
+        self._board.remove(coordinates=[(_row, _col) for _row, _col, _ in move.tiles], dictionary=self.dictionary)
+        self._racks[player].add(letters=[" " if _letter.islower() else _letter for _, _, _letter in move.tiles])
+
+    def _search(self, depth: int, alpha: float, beta: float, player: int,
+                nr_scoreless: int) -> Tuple[float, List[Optional[Move]]]:
+        self.nr_nodes += 1
+        if self.nr_nodes >= self._node_budget or (self.nr_nodes % 64 == 0 and time.perf_counter() > self._deadline):
+            raise _Budget()
+        _rack, _opponent_rack = self._racks[player].letters, self._racks[1 - player].letters
+        if depth == 0:
+            self._cut = True
+            return _rack_value(_opponent_rack) - _rack_value(_rack), []
+
+        _key = self._hash(player=player, nr_scoreless=nr_scoreless)
+        _entry = self._table.get(_key)
+        _hint = None
+        if _entry is not None:
+            _depth, _value, _flag, _hint, _line, _cut = _entry
+            # Values searched to the end of the game hold for any depth
+            if (_depth >= depth or not _cut) and (_flag == _EXACT or (_flag == _LOWER and _value >= beta)
+                                                 or (_flag == _UPPER and _value <= alpha)):
+                self._cut |= _cut
+                return _value, _line
+
+        _moves = self.generator.generate(letters=self._board.letters, rack=_rack,
+                                         cross_checks=self._board.cross_checks,
+                                         line_versions=self._board.line_versions)
+        _scores = score_moves(letters=self._board.letters, blanks=self._board.blanks, moves=_moves).tolist()
+        # Previous best move first, then moves going out, then by score, passing counts as a move scoring 0
+        _candidates = sorted(list(zip(_moves, _scores)) + [(None, 0)],
+                             key=lambda _candidate: (_candidate[0] != _hint,
+                                                     _candidate[0] is None or len(_candidate[0].tiles) != len(_rack),
+                                                     -_candidate[1]))
+
+        # Tracking whether this subtree hits the depth limit anywhere
+        _outer_cut, self._cut = self._cut, False
+        _alpha, _best, _best_line = alpha, -np.inf, []
+        for _move, _score in _candidates:
+            _scoreless = 0 if _score > 0 else nr_scoreless + 1
+            _line = []
+            if _move is not None and len(_move.tiles) == len(_rack):
+                # Going out, gaining the value of the opponent's rack twice over the spread
+                _value = _score + 2 * _rack_value(_opponent_rack)
+            elif _scoreless >= Game.MAX_SCORELESS_TURNS:
+                # Game ends, both players lose the value of the tiles left on their racks
+                _kept = _rack_value(_rack) - (_rack_value([_tile for _, _, _tile in _move.tiles]) if _move else 0)
+                _value = _score + _rack_value(_opponent_rack) - _kept
+            elif _move is None:
+                _child, _line = self._search(depth=depth - 1, alpha=-beta, beta=-_alpha, player=1 - player,
+                                             nr_scoreless=_scoreless)
+                _value = -_child
+            else:
+                self._place(player=player, move=_move)
+                try:
+                    # The window is shifted by the score of the move, the child values the rest of the game
+                    _child, _line = self._search(depth=depth - 1, alpha=_score - beta, beta=_score - _alpha,
+                                                 player=1 - player, nr_scoreless=_scoreless)
+                finally:
+                    self._take_back(player=player, move=_move)
+                _value = _score - _child
+            if _value > _best:
+                _best, _best_line = _value, [_move] + _line
+            _alpha = max(_alpha, _value)
+            if _alpha >= beta:
+                break
+
+        _flag = _UPPER if _best <= alpha else (_LOWER if _best >= beta else _EXACT)
+        self._table[_key] = (depth, _best, _flag, _best_line[0], _best_line, self._cut)
+        self._cut |= _outer_cut
+        return _best, _best_line
+
+    def solve(self, game: Game, time_budget: float = 5.0, node_budget: int = None,
+              max_depth: int = 2 * HAND_SIZE) -> EndgameResult:
+        """ Best line for the player in turn of a two player game with an empty bag, from the
+            deepest iteration finished within the budgets. Only if result.complete is the line
+            optimal, otherwise it is a depth-limited estimate (e.g. full racks need far more than
+            a few seconds to be searched to the end). """
+        assert len(game.bag) == 0, 'Endgames start once the bag is empty.'
+        assert len(game.racks) == 2, 'Endgames are solved for two players.'
+        _start = time.perf_counter()
+        self._deadline = _start + time_budget
+        self._node_budget = node_budget if node_budget is not None else np.inf
+        self._board = game.board.copy()
+        self._racks = [Rack(letters=game.racks[game.current_player].letters, player=0),
+                       Rack(letters=game.racks[1 - game.current_player].letters, player=1)]
+        self._table = {}
+        self.nr_nodes = 0
+
+        _result = EndgameResult(moves=[], value=0.0, depth=0, complete=False, nr_nodes=0, duration=0.0)
+        for _depth in range(1, max_depth + 1):
+            self._cut = False
+            try:
+                _value, _line = self._search(depth=_depth, alpha=-np.inf, beta=np.inf, player=0,
+                                             nr_scoreless=game.nr_scoreless_turns)
+            except _Budget:
+                break
+            _result = EndgameResult(moves=_line, value=float(_value), depth=_depth, complete=not self._cut,
+                                    nr_nodes=self.nr_nodes, duration=time.perf_counter() - _start)
+            if _result.complete:
+                break
+        return _result._replace(nr_nodes=self.nr_nodes, duration=time.perf_counter() - _start)
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description="Plays a seeded game greedily until the bag is empty and solves "
+                                                  "the endgame.")
+    _parser.add_argument("--seed", type=int, default=0, help="Seed of the game.")
+    _parser.add_argument("--budget", type=float, default=10.0, help="Seconds for the search.")
+    _args = _parser.parse_args()
+
+    _dictionary = get_lexicon()
+    _game = Game(dictionary=_dictionary, seed=_args.seed)
+    while not _game.is_over and len(_game.bag) > 0:
+        _moves = _game.legal_moves()
+        if not _moves:
+            _game.pass_turn()
+            continue
+        _game.play_move(move=_moves[int(np.argmax(_game.score_moves(moves=_moves)))])
+    if _game.is_over:
+        print(f'Game {_args.seed} ended before the bag was empty.')
+    else:
+        print(f'Racks: {"".join(_game.current_rack.letters)} (in turn) vs. '
+              f'{"".join(_game.racks[1 - _game.current_player].letters)}')
+        _result = EndgameSolver(dictionary=_dictionary).solve(game=_game, time_budget=_args.budget)
+        print(" ".join([_move.word if _move is not None else "(pass)" for _move in _result.moves]))
+        if _result.complete:
+            print(f'Exact: optimal line, spread {_result.value:+.0f}', end=" ")
+        else:
+            print(f'Estimate only: searched {_result.depth} plies, not to the end of the game, spread '
+                  f'{_result.value:+.0f} if the game ended there', end=" ")
+        print(f'({_result.nr_nodes} nodes in {_result.duration:.2f}s)')
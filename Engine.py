@@ -0,0 +1,454 @@
+import itertools
+import os
+from collections import deque
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from MoveGenerator import *
+from Scoring import *
+from Settings import *
+from Structures import *
+from Zobrist import *
+
+
+class SubmitResult(NamedTuple):
+    """ Outcome of submitting a play. """
+    valid: bool
+    words: List[str]  # Words formed by the play, main word first
+    score: int
+    reason: str  # Why the play was rejected, empty if valid
+
+
+# Planes of BoardState.one_hot: one per letter, blanks, one per remaining premium type
+NR_BOARD_PLANES = 26 + 1 + len(MULTIPLIER_TYPES)
+_LETTER_CODES = np.arange(1, 27, dtype=np.uint8)[:, None, None]
+_PREMIUM_CODES = np.arange(1, len(MULTIPLIER_TYPES) + 1, dtype=np.uint8)[:, None, None]
+
+
+def _reset_line_versions() -> None:
+    """ Source of BoardState.line_versions, lines of different boards never share a version. Boards
+        are sent between processes, so every process (forked ones too) counts from a random start. """
+    global _LINE_VERSIONS
+    _LINE_VERSIONS = itertools.count((int.from_bytes(os.urandom(8), "little") >> 2) + 1)
+
+
+_reset_line_versions()
+if hasattr(os, "register_at_fork"):  # Unix only, spawned processes reset the counter when importing this module
+    os.register_at_fork(after_in_child=_reset_line_versions)
+
+
+class BoardState:
+    """ Pure data board holding the committed tiles: letter codes (see Settings.EMPTY),
+    blank flags, the premiums not yet covered by a tile (see Scoring.PREMIUM_CODES) and the
+    cross-check masks cross_checks[direction, row, col] of every square for plays along
+    direction. All planes are updated in place as tiles are placed and removed, together with
+    a Zobrist hash of the tiles (see Zobrist.square_key) and a version of every row
+    (line_versions[ACROSS, row]) and column (line_versions[DOWN, col]) that is renewed when a
+    play changes the letters, anchors or cross-checks of the line, so caches (see
+    MoveGenerator) only redo the dirty lines. Taking back the last plays (as searches do) restores
+    the versions the lines had before, so cached lines of the earlier position are hit again.
+    Copies keep the versions of the original. """
+
+    MAX_RESTORED_PLAYS = 32  # Plays whose previous line versions are kept for remove
+
+    def __init__(self, size: int = 15) -> None:
+        self.size = size
+        self.letters = np.zeros(shape=(size, size), dtype=np.uint8)
+        self.blanks = np.zeros(shape=(size, size), dtype=bool)
+        self.premiums = PREMIUM_CODES.copy() if size == BOARD_SIZE else np.zeros(shape=(size, size), dtype=np.uint8)
+        self.cross_checks = np.full(shape=(2, size, size), fill_value=FULL_MASK, dtype=np.uint32)
+        self.nr_tiles = 0
+        self.hash = 0
+        self.line_versions = np.zeros(shape=(2, size), dtype=np.int64)  # 0 is the version of an empty board
+        # (squares, line versions before) of the last plays, the latest last
+        self._placed = deque(maxlen=self.MAX_RESTORED_PLAYS)
+
+    @staticmethod
+    def _read_only(plane: np.ndarray) -> np.ndarray:
+        _view = plane.view()
+        _view.flags.writeable = False
+        return _view
+
+    def planes(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Read-only views of the letter, blank and premium planes, they follow later plays. """
+        # Made on every call, views kept on the board would be pickled as arrays of their own
+        return self._read_only(self.letters), self._read_only(self.blanks), self._read_only(self.premiums)
+
+    def one_hot(self, out: np.ndarray) -> np.ndarray:
+        """ Writes the board as NR_BOARD_PLANES one-hot planes (letters A..Z, blanks, remaining
+            premiums by Settings.MULTIPLIER_TYPES) into out of shape (NR_BOARD_PLANES, size, size). """
+        assert out.shape == (NR_BOARD_PLANES, self.size, self.size), \
+            f'Expected buffer of shape {(NR_BOARD_PLANES, self.size, self.size)}, got {out.shape}.'
+        np.equal(self.letters, _LETTER_CODES, out=out[:26])
+        np.copyto(out[26], self.blanks)
+        np.equal(self.premiums, _PREMIUM_CODES, out=out[27:])
+        return out
+
+    def is_empty(self) -> bool:
+        return self.nr_tiles == 0
+
+    def letter_at(self, row: int, col: int) -> str:
+        """ Letter on square (row, col), lower case if played with a blank, empty string if free. """
+        _code = self.letters[row, col]
+        if not _code:
+            return ""
+        return ALPHABET[_code - 1].lower() if self.blanks[row, col] else ALPHABET[_code - 1]
+
+    def cross_check(self, row: int, col: int, direction: int) -> int:
+        return int(self.cross_checks[direction, row, col])
+
+    def place(self, tiles: List[Tuple[int, int, str]], dictionary: DAWG) -> None:
+        """ Puts tiles (row, col, letter), lower case letters being blanks, on the board. """
+        for _row, _col, _letter in tiles:
+            assert not self.letters[_row, _col], f'Square {_row, _col} is already occupied.'
+            self.letters[_row, _col] = LETTER_INDEX[_letter.upper()] + 1
+            self.blanks[_row, _col] = _letter.islower()
+            self.premiums[_row, _col] = 0
+            self.hash ^= square_key(row=_row, col=_col, letter=_letter)
+        self.nr_tiles += len(tiles)
+        _coordinates = [(_row, _col) for _row, _col, _ in tiles]
+        self._placed.append((frozenset(_coordinates), self.line_versions.copy()))
+        _squares = update_cross_checks(letters=self.letters, cross_checks=self.cross_checks,
+                                       coordinates=_coordinates, dictionary=dictionary)
+        self._renew_lines(coordinates=_coordinates, squares=_squares)
+
+    def remove(self, coordinates: List[Tuple[int, int]], dictionary: DAWG) -> None:
+        """ Takes the tiles on coordinates off the board again. """
+        for _row, _col in coordinates:
+            assert self.letters[_row, _col], f'Square {_row, _col} is empty.'
+            self.hash ^= square_key(row=_row, col=_col, letter=self.letter_at(row=_row, col=_col))
+            self.letters[_row, _col] = EMPTY
+            self.blanks[_row, _col] = False
+            if self.size == BOARD_SIZE:
+                self.premiums[_row, _col] = PREMIUM_CODES[_row, _col]
+        self.nr_tiles -= len(coordinates)
+        _squares = update_cross_checks(letters=self.letters, cross_checks=self.cross_checks,
+                                       coordinates=coordinates, dictionary=dictionary)
+        if self._placed and self._placed[-1][0] == frozenset([(_row, _col) for _row, _col in coordinates]):
+            # Taking back the last play, the lines are as they were before it
+            np.copyto(self.line_versions, self._placed.pop()[1])
+        else:
+            # The versions kept for earlier plays include the tiles taken off now
+            self._placed.clear()
+            self._renew_lines(coordinates=coordinates, squares=_squares)
+
+    def _renew_lines(self, coordinates: List[Tuple[int, int]], squares: List[Tuple[int, int]]) -> None:
+        """ New versions for the lines through and next to the changed squares (letters and
+            anchors) and through the squares whose cross-checks were updated. """
+        _rows, _cols = set(), set()
+        for _row, _col in coordinates:
+            _rows.update((_row - 1, _row, _row + 1))
+            _cols.update((_col - 1, _col, _col + 1))
+        for _row, _col in squares:
+            _rows.add(_row)
+            _cols.add(_col)
+        _version = next(_LINE_VERSIONS)
+        self.line_versions[ACROSS, [_row for _row in _rows if 0 <= _row < self.size]] = _version
+        self.line_versions[DOWN, [_col for _col in _cols if 0 <= _col < self.size]] = _version
+
+    def copy(self) -> 'BoardState':
+        _board = BoardState(size=self.size)
+        np.copyto(_board.letters, self.letters)
+        np.copyto(_board.blanks, self.blanks)
+        np.copyto(_board.premiums, self.premiums)
+        np.copyto(_board.cross_checks, self.cross_checks)
+        _board.nr_tiles = self.nr_tiles
+        _board.hash = self.hash
+        np.copyto(_board.line_versions, self.line_versions)
+        return _board
+
+
+def _word_through(board: BoardState, placed: dict, coordinate: Tuple[int, int],
+                  direction: int) -> List[Tuple[int, int, str]]:
+    """ (row, col, letter) of the contiguous tiles through coordinate along direction,
+        with the tiles in 'placed' put on top of the board. """
+    _d_row, _d_col = (0, 1) if direction == ACROSS else (1, 0)
+    _row, _col = coordinate
+
+    def letter(_r: int, _c: int) -> str:
+        return placed.get((_r, _c)) or board.letter_at(row=_r, col=_c)
+
+    # Walking back to first letter of the word
+    while 0 <= _row - _d_row and 0 <= _col - _d_col and letter(_row - _d_row, _col - _d_col):
+        _row, _col = _row - _d_row, _col - _d_col
+    _squares = []
+    while _row < board.size and _col < board.size and letter(_row, _col):
+        _squares.append((_row, _col, letter(_row, _col)))
+        _row, _col = _row + _d_row, _col + _d_col
+    return _squares
+
+
+def _word_score(squares: List[Tuple[int, int, str]], placed: dict) -> int:
+    """ Score of a word, premium squares only count for the tiles placed this turn. """
+    _score, _word_multiplier = 0, 1
+    for _row, _col, _letter in squares:
+        _value = TILE_POINTS[_letter]
+        if (_row, _col) in placed:
+            _value *= int(LETTER_MULTIPLIERS[_row, _col])
+            _word_multiplier *= int(WORD_MULTIPLIERS[_row, _col])
+        _score += _value
+    return _score * _word_multiplier
+
+
+def evaluate_play(board: BoardState, tiles: List[Tuple[int, int, str]], dictionary: DAWG) -> SubmitResult:
+    """ Validates and scores tiles (row, col, letter) placed on board by only looking at the words
+        they form: the main word along the play and the cross-words through each placed tile.
+        Cross-words are checked with the cross-check masks of the board, the main word with the
+        dictionary. Lower case letters are blanks, " " is a blank without a chosen letter. """
+    if not tiles:
+        return SubmitResult(valid=False, words=[], score=0, reason="No letters placed.")
+    placed = {(_row, _col): _letter for _row, _col, _letter in tiles}
+    if len(placed) != len(tiles) or any(board.letters[_row, _col] for _row, _col in placed):
+        return SubmitResult(valid=False, words=[], score=0, reason="Square is already occupied.")
+    _rows = {_row for _row, _, _ in tiles}
+    _cols = {_col for _, _col, _ in tiles}
+    if len(_rows) > 1 and len(_cols) > 1:
+        return SubmitResult(valid=False, words=[], score=0, reason="Letters are not in one row or column.")
+
+    # Direction of the main word, a single letter plays along the line where it forms a word
+    _first = (tiles[0][0], tiles[0][1])
+    if len(tiles) > 1:
+        _direction = ACROSS if len(_rows) == 1 else DOWN
+    else:
+        _direction = ACROSS if len(_word_through(board, placed, _first, ACROSS)) >= 2 else DOWN
+
+    _main = _word_through(board, placed, _first, _direction)
+    if not set(placed).issubset((_row, _col) for _row, _col, _ in _main):
+        return SubmitResult(valid=False, words=[], score=0, reason="Letters are not contiguous.")
+    if len(_main) < 2:
+        return SubmitResult(valid=False, words=[], score=0, reason="A word needs at least two letters.")
+    _main_word = "".join(_letter for _, _, _letter in _main).upper()
+
+    _words = [_main_word]
+    _score = _word_score(squares=_main, placed=placed)
+    _touches_board = len(_main) > len(tiles)
+    for _row, _col, _letter in tiles:
+        _cross = _word_through(board, placed, (_row, _col), 1 - _direction)
+        if len(_cross) < 2:
+            continue
+        _touches_board = True
+        _cross_word = "".join(_letter for _, _, _letter in _cross).upper()
+        if not board.cross_check(row=_row, col=_col, direction=_direction) & (1 << LETTER_INDEX[_letter.upper()]):
+            return SubmitResult(valid=False, words=_words + [_cross_word], score=0,
+                                reason=f'{_cross_word} is not a word.')
+        _words.append(_cross_word)
+        _score += _word_score(squares=_cross, placed=placed)
+
+    # First word has to cover the center square, later words have to join the tiles on the board
+    if board.is_empty():
+        if (board.size // 2, board.size // 2) not in placed:
+            return SubmitResult(valid=False, words=_words, score=0, reason="First word has to cover the center.")
+    elif not _touches_board:
+        return SubmitResult(valid=False, words=_words, score=0,
+                            reason="Letters are not connected to the tiles on the board.")
+
+    if not dictionary.holds(word=_main_word):
+        return SubmitResult(valid=False, words=_words, score=0, reason=f'{_main_word} is not a word.')
+
+    if len(tiles) == HAND_SIZE:
+        _score += BINGO_BONUS
+    return SubmitResult(valid=True, words=_words, score=_score, reason="")
+
+
+class Rack:
+    """ Letters on a player's rack, " " being a blank. Change the letters with add and remove
+    only, they keep the Zobrist hash of the rack (see Zobrist.rack_hash) up to date. """
+
+    def __init__(self, letters: List[str] = None, player: int = 0) -> None:
+        self.letters = list(letters) if letters is not None else []
+        self.player = player
+        self.hash = rack_hash(letters=self.letters, player=player)
+
+    def __len__(self) -> int:
+        return len(self.letters)
+
+    def add(self, letters: List[str]) -> None:
+        for _letter in letters:
+            _index = LETTER_INDEX[_letter]
+            self.hash ^= RACK_KEYS[self.player][_index][self.letters.count(_letter)]
+            self.letters.append(_letter)
+
+    def remove(self, letters: List[str]) -> None:
+        """ Removes letters from the rack, lower case letters take a blank. """
+        for _letter in letters:
+            _tile = " " if _letter.islower() else _letter
+            self.letters.remove(_tile)
+            self.hash ^= RACK_KEYS[self.player][LETTER_INDEX[_tile]][self.letters.count(_tile)]
+
+    def value(self) -> int:
+        return sum([POINT_DISTRIBUTION[_letter] for _letter in self.letters])
+
+
+class Bag:
+    """ Tiles not yet drawn, kept as the number of tiles of each ALPHABET letter (blanks last)
+    and drawn without replacement with the game's own numpy random generator. """
+
+    def __init__(self, rng: np.random.Generator, distribution: dict = None) -> None:
+        if distribution is None:
+            distribution = LETTER_DISTRIBUTION
+        self.rng = rng
+        self.counts = np.array([distribution[_letter] for _letter in ALPHABET], dtype=np.int64)
+        self.size = int(self.counts.sum())
+        self.hash = bag_hash(counts=self.counts.tolist())
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def letters(self) -> List[str]:
+        """ Remaining tiles in ALPHABET order. """
+        return [_letter for _letter, _count in zip(ALPHABET, self.counts.tolist()) for _ in range(_count)]
+
+    def draw_counts(self, size: int) -> np.ndarray:
+        """ Draws size tiles and returns how many of each letter were drawn. """
+        assert size <= self.size, f'Not enough letters remaining, wanted size: {size}, \
+                                    remaining letters: {self.size}.'
+        # Drawing size tiles without replacement is one multivariate hypergeometric sample
+        _drawn = self.rng.multivariate_hypergeometric(self.counts, size, method="count")
+        for _index in np.flatnonzero(_drawn).tolist():
+            _count = int(self.counts[_index])
+            self.hash ^= BAG_KEYS[_index][_count] ^ BAG_KEYS[_index][_count - int(_drawn[_index])]
+        self.counts -= _drawn
+        self.size -= size
+        return _drawn
+
+    def draw(self, size: int) -> List[str]:
+        return [_letter for _letter, _count in zip(ALPHABET, self.draw_counts(size=size).tolist())
+                for _ in range(_count)]
+
+    def put_back(self, letters: List[str]) -> None:
+        """ Returns tiles to the bag, e.g. when exchanging, lower case letters being blanks. """
+        for _letter in letters:
+            _index = BLANK_INDEX if _letter.islower() else LETTER_INDEX[_letter]
+            _count = int(self.counts[_index])
+            self.hash ^= BAG_KEYS[_index][_count] ^ BAG_KEYS[_index][_count + 1]
+            self.counts[_index] += 1
+        self.size += len(letters)
+
+
+# Kinds of Turn
+TURN_PLAY, TURN_EXCHANGE, TURN_PASS = 0, 1, 2
+
+
+class Turn(NamedTuple):
+    """ One turn of a game, see Game.history. """
+    player: int
+    rack: Tuple[str, ...]  # Rack before the turn
+    kind: int  # TURN_PLAY, TURN_EXCHANGE or TURN_PASS
+    tiles: Tuple[Tuple[int, int, str], ...]  # (row, col, letter) placed by a play, lower case letters being blanks
+    exchanged: Tuple[str, ...]  # Letters put back by an exchange
+    score: int
+
+
+class Game:
+    """ Headless game: board, bag, racks and scores of all players, with turn handling and
+    end of game rules. Contains no pygame objects, so any number of games can run without a display.
+    Every turn is appended to history, see GameRecords for saving and replaying games. """
+
+    MAX_SCORELESS_TURNS = 6  # The game ends after this many turns in a row without points
+
+    def __init__(self, dictionary: DAWG, seed: int = None, nr_players: int = 2) -> None:
+        assert nr_players <= MAX_PLAYERS, f'At most {MAX_PLAYERS} players, got {nr_players}.'
+        self.dictionary = dictionary
+        self.move_generator = MoveGenerator(dictionary=dictionary)
+        self.seed = seed
+        self.board = BoardState()
+        self.bag = Bag(rng=np.random.default_rng(seed))
+        self.racks = [Rack(letters=self.bag.draw(size=HAND_SIZE), player=_player) for _player in range(nr_players)]
+        self.scores = [0] * nr_players
+        self.turn = 0
+        self.nr_scoreless_turns = 0
+        self.is_over = False
+        self.history: List[Turn] = []
+
+    @property
+    def current_player(self) -> int:
+        return self.turn % len(self.racks)
+
+    @property
+    def current_rack(self) -> Rack:
+        return self.racks[self.current_player]
+
+    @property
+    def hash(self) -> int:
+        """ 64 bit Zobrist hash of the board, racks, bag, player in turn and number of scoreless
+            turns, equal for equal states in any process. """
+        _hash = self.board.hash ^ self.bag.hash ^ PLAYER_KEYS[self.current_player] ^ \
+            SCORELESS_KEYS[min(self.nr_scoreless_turns, self.MAX_SCORELESS_TURNS)]
+        for _rack in self.racks:
+            _hash ^= _rack.hash
+        return _hash
+
+    def legal_moves(self) -> List[Move]:
+        return self.move_generator.generate(letters=self.board.letters, rack=self.current_rack.letters,
+                                            cross_checks=self.board.cross_checks,
+                                            line_versions=self.board.line_versions)
+
+    def score_moves(self, moves: List[Move]) -> np.ndarray:
+        """ Scores of legal moves on the current board, see Scoring.score_moves. """
+        return score_moves(letters=self.board.letters, blanks=self.board.blanks, moves=moves)
+
+    def play(self, tiles: List[Tuple[int, int, str]]) -> SubmitResult:
+        """ Validates tiles (row, col, letter) from the current rack and, if legal, puts them
+            on the board, scores them and refills the rack. """
+        assert not self.is_over, 'Game is over.'
+        _rack = list(self.current_rack.letters)
+        for _, _, _letter in tiles:
+            _tile = " " if _letter.islower() or _letter == " " else _letter
+            if _tile not in _rack:
+                return SubmitResult(valid=False, words=[], score=0, reason=f'Letter {_letter} is not on the rack.')
+            _rack.remove(_tile)
+        _result = evaluate_play(board=self.board, tiles=tiles, dictionary=self.dictionary)
+        if not _result.valid:
+            return _result
+        self.history.append(Turn(player=self.current_player, rack=tuple(self.current_rack.letters), kind=TURN_PLAY,
+                                 tiles=tuple(tiles), exchanged=(), score=_result.score))
+        self.board.place(tiles=tiles, dictionary=self.dictionary)
+        self.current_rack.remove(letters=[_letter for _, _, _letter in tiles])
+        self.current_rack.add(letters=self.bag.draw(size=min(len(tiles), len(self.bag))))
+        self.scores[self.current_player] += _result.score
+        self._end_turn(scored=_result.score > 0)
+        return _result
+
+    def play_move(self, move: Move) -> SubmitResult:
+        return self.play(tiles=list(move.tiles))
+
+    def pass_turn(self) -> None:
+        assert not self.is_over, 'Game is over.'
+        self.history.append(Turn(player=self.current_player, rack=tuple(self.current_rack.letters), kind=TURN_PASS,
+                                 tiles=(), exchanged=(), score=0))
+        self._end_turn(scored=False)
+
+    def exchange(self, letters: List[str]) -> None:
+        """ Swaps letters of the current rack with tiles from the bag, allowed while the bag holds a full rack. """
+        assert not self.is_over, 'Game is over.'
+        assert len(self.bag) >= HAND_SIZE, 'Not enough letters in bag to exchange.'
+        self.history.append(Turn(player=self.current_player, rack=tuple(self.current_rack.letters), kind=TURN_EXCHANGE,
+                                 tiles=(), exchanged=tuple(letters), score=0))
+        self.current_rack.remove(letters=letters)
+        _new_letters = self.bag.draw(size=len(letters))
+        self.bag.put_back(letters=letters)
+        self.current_rack.add(letters=_new_letters)
+        self._end_turn(scored=False)
+
+    def _end_turn(self, scored: bool) -> None:
+        self.nr_scoreless_turns = 0 if scored else self.nr_scoreless_turns + 1
+        if len(self.bag) == 0 and len(self.current_rack) == 0:
+            self._finish(went_out=self.current_player)
+        elif self.nr_scoreless_turns >= self.MAX_SCORELESS_TURNS:
+            self._finish(went_out=None)
+        self.turn += 1
+
+    def _finish(self, went_out: Optional[int]) -> None:
+        """ Subtracts the letters left on each rack, the player going out gains those of the others. """
+        for _player, _rack in enumerate(self.racks):
+            self.scores[_player] -= _rack.value()
+            if went_out is not None:
+                self.scores[went_out] += _rack.value()
+        self.is_over = True
+
+    def winner(self) -> Optional[int]:
+        """ Index of the player with the highest score, None on a tie. """
+        _best = max(self.scores)
+        return self.scores.index(_best) if self.scores.count(_best) == 1 else None
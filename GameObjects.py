@@ -1,30 +1,64 @@
-import random
-from typing import List, Tuple, Union
+from collections import OrderedDict
+from typing import List, Optional, Tuple, Union
 
 import pygame
 import numpy as np
 
+from Engine import *
+from MoveGenerator import *
+from Scoring import *
 from Settings import *
 from Structures import *
 
 
 # TODO: Find a way to make set_pressed(coordinate) method shared for 'Hand' and 'Board' class instead of writing 2 times.
 
+class TextCache:
+    """ Fonts shared by size and rendered text surfaces shared by (text, size, color),
+    so equal labels are only rendered once. Surfaces are evicted least recently used first. """
+    def __init__(self, font_path: str = "media/Scrabble_font.otf", max_surfaces: int = 1024) -> None:
+        self.font_path = font_path
+        self.max_surfaces = max_surfaces
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+
+    def get_font(self, text_size: int) -> pygame.font.Font:
+        _font = self.fonts.get(text_size)
+        if _font is None:
+            if not pygame.font.get_init():
+                pygame.font.init()
+            _font = self.fonts[text_size] = pygame.font.Font(self.font_path, text_size)
+        return _font
+
+    def render(self, text: str, text_size: int, text_color: Tuple[int, int, int]) -> pygame.Surface:
+        _key = (text, text_size, text_color)
+        _surface = self.surfaces.get(_key)
+        if _surface is None:
+            _surface = self.surfaces[_key] = self.get_font(text_size=text_size).render(text, True, text_color)
+            if len(self.surfaces) > self.max_surfaces:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(_key)
+        return _surface
+
+
+TEXT_CACHE = TextCache()
+
+
 class PygameText:
     def __init__(self, text: str,
                  text_size: int,
                  text_color: Tuple[int, int, int],
                  center_x: int,
                  center_y: int) -> None:
-        pygame.font.init()
-
         self.text = text
         self.text_size = text_size
         self.text_color = text_color
 
-        self.font = pygame.font.Font("media/Scrabble_font.otf", self.text_size)
+        # Shared with every other text of the same size (and content and color)
+        self.font = TEXT_CACHE.get_font(text_size=self.text_size)
 
-        self.text_surface = self.font.render(self.text, True, self.text_color)
+        self.text_surface = TEXT_CACHE.render(text=self.text, text_size=self.text_size, text_color=self.text_color)
 
         self.text_rect = self.text_surface.get_rect()
 
@@ -42,6 +76,10 @@ class PygameButton:
         self.left, self.top = UL_anchor
         self.width, self.height = width, height
 
+        self.dirty = True  # Bool for checking if button has to be redrawn
+        self._color = None
+        self._is_pressed = False
+
         self.color = color
         self.un_highlighted_color = self.color
         self.highlighted_color = (self.un_highlighted_color[0] + 25,
@@ -69,6 +107,27 @@ class PygameButton:
         self.rect = pygame.Rect(0, 0, self.width, self.height)
         self.rect.left, self.rect.top = self.left, self.top
 
+    # Color and pressed state mark the button dirty when they change
+    @property
+    def color(self) -> Tuple[int, int, int]:
+        return self._color
+
+    @color.setter
+    def color(self, color: Tuple[int, int, int]) -> None:
+        if color != self._color:
+            self._color = color
+            self.dirty = True
+
+    @property
+    def is_pressed(self) -> bool:
+        return self._is_pressed
+
+    @is_pressed.setter
+    def is_pressed(self, is_pressed: bool) -> None:
+        if is_pressed != self._is_pressed:
+            self._is_pressed = is_pressed
+            self.dirty = True
+
     def get_color(self):
         if self.is_pressed:
             return self.pressed_color
@@ -86,6 +145,9 @@ class PygameButton:
                               self.un_highlighted_color[1] + 45,
                               self.un_highlighted_color[2] + 45)
 
+    def set_highlighted(self, highlighted: bool) -> None:
+        self.color = self.highlighted_color if highlighted else self.un_highlighted_color
+
     def check_pressed(self, event):
         if self.is_highlighted():
             if event.type == pygame.MOUSEBUTTONDOWN:
@@ -151,33 +213,44 @@ class Cell:
     def is_multiplier(self) -> bool:
         return self.has_multiplier
 
+    def mark_dirty(self) -> None:
+        """ Flags the cell for redrawing on the next frame. """
+        if self.button is not None:
+            self.button.dirty = True
+
     def set_content(self, content: Union[str, PygameText]) -> None:
         self.occupied = True
         self.content = content
+        self.mark_dirty()
 
     def set_score(self, score: Union[str, PygameText]) -> None:
         self.has_score = True
         self.score = score
+        self.mark_dirty()
 
     def set_multiplier(self, multiplier: Union[str, PygameText]) -> None:
         self.has_multiplier = True
         self.multiplier = multiplier
+        self.mark_dirty()
 
     def remove_content(self) -> None:
         self.content = None
         self.button.is_pressed = False
         if self.is_occupied():
             self.occupied = False
+        self.mark_dirty()
 
     def remove_score(self) -> None:
         self.score = None
         if self.is_score():
             self.has_score = False
+        self.mark_dirty()
 
     def remove_multiplier(self) -> None:
         self.multiplier = None
         if self.is_multiplier():
             self.has_multiplier = False
+        self.mark_dirty()
 
     def set_type(self, cell_type: str) -> None:
         assert cell_type in CELL_TYPES, f'Type: {self.type} is not known, use any of: {CELL_TYPES}.'
@@ -195,9 +268,12 @@ class Cell:
 
 
 class Board:
+    """ Pygame view of a BoardState: the state holds the committed tiles, the cells of the
+    grid display them together with the letters placed in the current play. """
     def __init__(self, nr_rows: int = 15,
                  nr_cols: int = 15,
-                 board_size: Tuple[int, int] = (600, 600)) -> None:
+                 board_size: Tuple[int, int] = (600, 600),
+                 state: BoardState = None) -> None:
 
         self.nr_rows = nr_rows
         self.nr_cols = nr_cols
@@ -214,6 +290,11 @@ class Board:
         self.has_pressed = False  # Bool for checking if any button on board is pressed
         self.pressed_coord = None  # Tuple of index coordinates of pressed button
 
+        # Committed tiles and cross-checks
+        self.state = state if state is not None else BoardState(size=self.nr_rows)
+        # Zobrist hash of the letters of the current play, see hash
+        self.pending_hash = 0
+
         self._initialize()
 
     def _initialize(self):
@@ -246,6 +327,61 @@ class Board:
                 _board_array[_row, _col] = (_content, _type)
         return _board_array
 
+    def get_board_planes(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Read-only views of the letter, blank and premium planes of the committed tiles,
+            no copies are made, see Engine.BoardState.planes. """
+        return self.state.planes()
+
+    def get_board_one_hot(self, out: np.ndarray) -> np.ndarray:
+        """ One-hot planes of the committed tiles written into out, see Engine.BoardState.one_hot. """
+        return self.state.one_hot(out=out)
+
+    @property
+    def letters(self) -> np.ndarray:
+        """ Letter codes (see Settings.EMPTY) of the committed tiles. """
+        return self.state.letters
+
+    @property
+    def cross_checks(self) -> np.ndarray:
+        return self.state.cross_checks
+
+    def get_letters(self) -> np.ndarray:
+        """ Letter codes (see Settings.EMPTY) of the committed tiles as used by the move generator. """
+        return self.state.letters.copy()
+
+    def get_cross_check(self, row: int, col: int, direction: int) -> int:
+        """ Mask of the letters (bit k = ALPHABET[k]) allowed on empty square (row, col) in a play along direction. """
+        return self.state.cross_check(row=row, col=col, direction=direction)
+
+    def get_tiles(self, coordinates: List[Tuple[int, int]]) -> List[Tuple[int, int, str]]:
+        """ (row, col, letter) of the letters shown on coordinates. """
+        return [(_row, _col, self.grid[_row, _col].content.text) for _row, _col in coordinates]
+
+    def commit_play(self, coordinates: List[Tuple[int, int]], dictionary: DAWG) -> None:
+        """ Makes the letters on coordinates permanent tiles of the board state. """
+        self.state.place(tiles=self.get_tiles(coordinates=coordinates), dictionary=dictionary)
+        self.clear_pending()
+
+    @property
+    def hash(self) -> int:
+        """ Zobrist hash of the shown letters: the committed tiles and those of the current play. """
+        return self.state.hash ^ self.pending_hash
+
+    def toggle_pending(self, coordinate: Tuple[int, int], letter: str) -> None:
+        """ Adds (or removes again) a letter of the current play on coordinate to the hash. """
+        self.pending_hash ^= square_key(row=coordinate[0], col=coordinate[1], letter=letter)
+
+    def clear_pending(self) -> None:
+        """ Forgets the letters of the current play, e.g. once the board state holds them. """
+        self.pending_hash = 0
+
+    def cell_at(self, position: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+        """ Index coordinate of the cell under pixel position, None if outside the board. """
+        _x, _y = position
+        if 0 <= _x < self.board_width and 0 <= _y < self.board_height:
+            return int(_y // self.cell_height), int(_x // self.cell_width)
+        return None
+
     # TODO: fix order w. respect to most commonly occurring
     def set_pressed(self, coordinate: Tuple[int, int]) -> None:
         # Same button clicked
@@ -268,33 +404,25 @@ class Board:
 
 
 class Letters:
-    def __init__(self, distribution=None):
-        if distribution is None:
-            distribution = LETTER_DISTRIBUTION
-        self._distribution = distribution
-        self.available_letters = []
-
-        self._initialize()
+    """ Bag of letters of a hand, see Engine.Bag. Draws are reproducible from the seed of rng. """
+    def __init__(self, rng: np.random.Generator, distribution=None):
+        self.bag = Bag(rng=rng, distribution=distribution)
 
-    def _initialize(self):
-        for _letter in ALPHABET:
-            for _nr_letters in range(self._distribution[_letter]):
-                self.available_letters.append(_letter)
+    @property
+    def available_letters(self) -> List[str]:
+        return self.bag.letters
 
     def sample(self, size: int = 7) -> List[str]:
-        assert size <= len(self.available_letters), f'Not enough letters remaining, wanted size: {size}, \
-                                                     remaining letters: {len(self.available_letters)}.'
-        random.shuffle(self.available_letters)
-        _hand = self.available_letters[:size]
-        self.available_letters = self.available_letters[size:]
-        return _hand
+        return self.bag.draw(size=size)
 
 
 class Hand:
     def __init__(self, hand_size: int = 7,
                  UL_anchor: Tuple[int, int] = (0, 600),  # Placement of upper left (UL) corner on screen.
                  background_width: int = 600,
-                 background_height: int = 200) -> None:
+                 background_height: int = 200,
+                 letters: List[str] = None,  # Letters to show, e.g. the rack of an Engine.Game
+                 rng: np.random.Generator = None) -> None:  # Seeded, shuffles the hand and draws from its own bag
         self.background_width = background_width
         self.background_height = background_height
         self.background_left, self.background_top = UL_anchor
@@ -307,9 +435,13 @@ class Hand:
         self.text_color = (255, 255, 255)
 
         self.hand_size = hand_size
-        self.available_letters = Letters(distribution=LETTER_DISTRIBUTION)
+        assert rng is not None, 'Pass a seeded rng, so shuffles and draws are reproducible.'
+        self.rng = rng
+        # A hand showing given letters (refilled with set_letters) has no bag of its own
+        self.available_letters = Letters(rng=rng, distribution=LETTER_DISTRIBUTION) if letters is None else None
         self.letter_cells = np.empty(shape=(7,), dtype=object)
-        self.letters = []
+        self.letters = list(letters) if letters is not None else []
+        self._sample_letters = letters is None
 
         self.has_pressed = False  # Bool for checking if any button on board is pressed
         self.pressed_coord = None  # Index coordinate for pressed button
@@ -322,19 +454,35 @@ class Hand:
         self.background_rect.top = self.background_top
         self.background_rect.left = self.background_left
         # Setting first 'Hand size' letters
-        self.letters = self.available_letters.sample(size=self.hand_size)
+        if self._sample_letters:
+            self.letters = self.available_letters.sample(size=self.hand_size)
         # Setting hand cells for letters
         for _cell in range(len(self.letter_cells)):
             self.letter_cells[_cell] = Cell(width=self.cell_size,
                                             height=self.cell_size,
                                             edge_color=WHITE,
                                             with_button=True)
-        # Setting text objects in cells
+        # Placing cells
         start_x = (self.background_width - self.hand_size * self.cell_size) // 2
         for _cell_nr, _cell in enumerate(self.letter_cells):
-            # Setting letter
             _cell.button.rect.left = start_x + _cell_nr * self.cell_size
             _cell.button.rect.top = self.background_top + self.top_buffer
+        # Setting text objects in cells
+        self.set_letters(letters=self.letters)
+
+    def set_letters(self, letters: List[str]) -> None:
+        """ Shows letters (e.g. the rack of the player in turn) in the hand cells. """
+        self.letters = list(letters)
+        self.has_pressed = False
+        self.pressed_coord = None
+        for _cell_nr, _cell in enumerate(self.letter_cells):
+            _cell.remove_content()
+            _cell.remove_score()
+            if _cell_nr >= len(self.letters):
+                _cell.button.set_color(color=BLACK)
+                continue
+            _cell.button.set_color(color=GREY)
+            # Setting letter
             _cell.set_content(PygameText(text=self.letters[_cell_nr],
                                          text_size=self.text_size,
                                          text_color=self.text_color,
@@ -350,7 +498,7 @@ class Hand:
     def shuffle_hand(self):
         # Shuffling letters
         assert len(self.letters) > 0, "No letters on hand."
-        random.shuffle(self.letters)
+        self.rng.shuffle(self.letters)
         _letter_counter = 0
         for _cell_nr, _cell in enumerate(self.letter_cells):
             if _cell.content is not None:
@@ -370,6 +518,7 @@ class Hand:
     def refill_hand(self):
         letters_on_hand = sum([1 for _cell in self.letter_cells if _cell.is_occupied()])
         assert letters_on_hand < self.hand_size, f'Hand is already full.'
+        assert self.available_letters is not None, 'Hand shows given letters, update it with set_letters.'
 
         # Sampling new letters
         new_letters = self.available_letters.sample(size=self.hand_size - letters_on_hand)
@@ -391,6 +540,14 @@ class Hand:
                                            center_x=_cell.button.rect.right - 9,
                                            center_y=_cell.button.rect.bottom - 9))
 
+    def cell_at(self, position: Tuple[int, int]) -> Optional[int]:
+        """ Index of the hand cell under pixel position, None if not on a hand cell. """
+        _x, _y = position
+        _left, _top = self.letter_cells[0].button.rect.left, self.letter_cells[0].button.rect.top
+        if _top <= _y < _top + self.cell_size and _left <= _x < _left + len(self.letter_cells) * self.cell_size:
+            return int((_x - _left) // self.cell_size)
+        return None
+
     def set_pressed(self, coordinate: int) -> None:
         # Same button clicked
         if self.has_pressed and self.pressed_coord == coordinate:
@@ -426,7 +583,8 @@ class LabeledTile:
         self.highlighted_color = (self.color[0] + 55,
                                   self.color[1] + 55,
                                   self.color[2] + 55)
-        self.highlighted = False
+        self.dirty = True  # Bool for checking if tile has to be redrawn
+        self._highlighted = False
 
         if text is not None:
             self.text_color = text_color
@@ -443,6 +601,16 @@ class LabeledTile:
         self.rect = pygame.Rect(0, 0, self.width, self.height)
         self.rect.left, self.rect.top = self.left, self.top
 
+    @property
+    def highlighted(self) -> bool:
+        return self._highlighted
+
+    @highlighted.setter
+    def highlighted(self, highlighted: bool) -> None:
+        if highlighted != self._highlighted:
+            self._highlighted = highlighted
+            self.dirty = True
+
     def set_highlighted(self):
         self.highlighted = True
 
@@ -453,27 +621,25 @@ class LabeledTile:
 
 
 class Play:
-    """ Class for handling a play in a round."""
+    """ Class for handling a play in a round. Its score is always computed from the board, see get_score."""
 
     def __init__(self):
-        self.score = 0
         self.board_coordinates = []  # Index coordinates of played cells on board
 
-    def add_played_cell(self, letter_score: int, board_coordinate: Tuple[int, int]) -> None:
+    def add_played_cell(self, board_coordinate: Tuple[int, int]) -> None:
         assert len(self.board_coordinates) <= 6, 'Should only be able to play a maximum of 7 letters in a round.'
-        self.score += letter_score
         self.board_coordinates.append(board_coordinate)
 
     def get_board_coordinates(self) -> np.ndarray:
         return np.array(self.board_coordinates)
 
-    # TODO: Account for multiplier score 
-    def get_score(self):
-        return self.score
+    def get_score(self, board: Board, dictionary: DAWG) -> int:
+        """ Score of the placed letters including premium squares, cross-words and bingo,
+            0 if they do not form a legal play. """
+        return evaluate_play(board=board.state, tiles=self.get_tiles(board=board), dictionary=dictionary).score
 
     def clear_play(self):
         self.board_coordinates = []
-        self.score = 0
 
     def return_letters(self, board: Board, hand: Hand):
         """ Returning played letters from board to hand. """
@@ -500,15 +666,16 @@ class Play:
         # Removing from board
         for _ in range(len(self.board_coordinates)):
             _row, _col = self.board_coordinates[_]
+            board.toggle_pending(coordinate=(_row, _col), letter=board.grid[_row, _col].content.text)
             board.grid[_row, _col].remove_content()
             board.grid[_row, _col].remove_score()
             # Re-inserting multiplier type text
-            for _multiplier_type, _coordinates in MULTIPLIER_ARRANGEMENT.items():
-                if (_row, _col) in _coordinates:
-                    board.grid[_row][_col].set_type(_multiplier_type)
-                    # Updating button color according to cell type
-                    board.grid[_row][_col].button.color = board.grid[_row][_col].color
-                    board.grid[_row][_col].button.un_highlighted_color = board.grid[_row][_col].color
+            _multiplier_type = PREMIUM_TYPES[_row, _col]
+            if _multiplier_type != "STANDARD":
+                board.grid[_row][_col].set_type(_multiplier_type)
+                # Updating button color according to cell type
+                board.grid[_row][_col].button.color = board.grid[_row][_col].color
+                board.grid[_row][_col].button.un_highlighted_color = board.grid[_row][_col].color
 
         self.clear_play()
 
@@ -530,89 +697,15 @@ class Play:
                 return False
         return True
 
-    @staticmethod
-    def horizontally_adjacent(_coordinates: List[Tuple[int, int]]) -> bool:
-        _initial = _coordinates[0]
-        for _count, _coord in enumerate(_coordinates):
-            if _coord[1] != _initial[1] + _count:
-                return False
-        return True
-
-    @staticmethod
-    def vertically_adjacent(_coordinates: List[Tuple[int, int]]) -> bool:
-        _initial = _coordinates[0]
-        for _count, _coord in enumerate(_coordinates):
-            if _coord[0] != _initial[0] + _count:
-                return False
-        return True
-
-    @staticmethod
-    def get_words(line: np.ndarray) -> List[str]:
-        sequences = []
-        current_sequence = ""
-        for cell in line:
-            if cell.content is not None:
-                current_sequence += cell.content.text
-            elif len(current_sequence) >= 2:
-                sequences.append(current_sequence)
-                current_sequence = ""
-            else:
-                current_sequence = ""
-        if len(current_sequence) >= 2:
-            sequences.append(current_sequence)
-        return sequences
-
-    def get_word(self, _board: Board, coordinates: List[Tuple[int, int]]) -> str:
-        if self.same_row(_coordinates=coordinates):
-            sorted_rows = [coord[0] for coord in coordinates]
-            sorted_coordinates = np.array(coordinates)[np.argsort(sorted_rows)].tolist()
-        else:
-            sorted_cols = [coord[1] for coord in coordinates]
-            sorted_coordinates = np.array(coordinates)[np.argsort(sorted_cols)].tolist()
-        _word = ""
-        for _coord in sorted_coordinates:
-            _row, _col = _coord
-            _word += _board.grid[_row, _col].content.text
-        return _word
-
-    def submit(self, round: int, board: Board, dictionary: Trie) -> bool:
-        # First word placed doesn't have to be adjacent to other letters
-        if round == 0:
-            if self.same_row(_coordinates=self.board_coordinates) or self.same_column(
-                    _coordinates=self.board_coordinates):
-                if self.horizontally_adjacent(_coordinates=self.board_coordinates) or self.vertically_adjacent(
-                        _coordinates=self.board_coordinates):
-                    _placed_word = self.get_word(_board=board, coordinates=self.board_coordinates)
-                    print("playing word:", _placed_word)
-                    if dictionary.holds(word=_placed_word):
-                        print("GREAT SUCCESS - WORD EXISTS IN DICTIONARY")
-                        self.clear_play()
-                        return True
-                    else:
-                        print("NOT SO GREAT SUCCESS - WORD DOESNT EXIST IN DICTIONARY")
-                        return False
-            else:
-                print("INVALID ARRANGEMENT OF LETTERS...")
-                return False
-        # All words except first one has to be adjacent to other letters
-        else:
-            _words = []
-            if self.same_row(_coordinates=self.board_coordinates) or self.same_column(
-                    _coordinates=self.board_coordinates):
-                for _row in range(board.grid.shape[0]):
-                    _current_words = self.get_words(line=board.grid[_row])
-                    for _word in _current_words:
-                        _words.append(_word)
-                for _col in range(board.grid.shape[1]):
-                    _current_words = self.get_words(line=board.grid[:, _col])
-                    for _word in _current_words:
-                        _words.append(_word)
-                for _word in _words:
-                    if not dictionary.holds(word=_word):
-                        return False
-                print("Made legal play and found words:", _words)
-                self.clear_play()
-                return True
-            else:
-                print("INVALID ARRANGEMENT OF LETTERS...")
-                return False
+    def get_tiles(self, board: Board) -> List[Tuple[int, int, str]]:
+        """ (row, col, letter) of the letters placed in this play. """
+        return board.get_tiles(coordinates=self.board_coordinates)
+
+    def submit(self, board: Board, dictionary: DAWG) -> SubmitResult:
+        """ Validates and scores the placed letters against the committed tiles of the board
+            (see Engine.evaluate_play) and commits them if they form a legal play. """
+        _result = evaluate_play(board=board.state, tiles=self.get_tiles(board=board), dictionary=dictionary)
+        if _result.valid:
+            board.commit_play(coordinates=self.board_coordinates, dictionary=dictionary)
+            self.clear_play()
+        return _result
@@ -0,0 +1,276 @@
+import argparse
+import os
+import struct
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from Engine import *
+
+# Record file layout, little endian:
+#   file header   magic b'SCRG', format version (H)
+#   every game    body length (I) followed by the body:
+#     seed (q), whether the game was seeded (B), nr_players (B), nr_turns (H), final scores (h each),
+#     final racks (per player: nr_letters (B), letter codes (B each)),
+#     turns (per turn: kind (B), nr_tiles or nr_exchanged (B), score (h), rack before the turn as
+#            nr_letters (B) and letter codes (B each), then per tile square (B, row * 15 + col) and
+#            letter code (B), or the letter codes of the exchanged letters)
+# Letter codes are 0 for a blank, 1..26 for A..Z and 27..52 for blanks played as A..Z.
+_MAGIC = b'SCRG'
+_VERSION = 1
+_FILE_HEADER = struct.Struct('<4sH')
+_LENGTH = struct.Struct('<I')
+_GAME_HEADER = struct.Struct('<qBBH')
+_TURN_HEADER = struct.Struct('<BBh')
+
+
+class GameRecord(NamedTuple):
+    """ Everything needed to replay a game: its seed, every turn and how it ended. """
+    seed: Optional[int]
+    turns: List[Turn]
+    final_racks: List[Tuple[str, ...]]
+    scores: List[int]  # Final scores, including the tiles left on the racks
+
+    @property
+    def nr_players(self) -> int:
+        return len(self.scores)
+
+
+def record_game(game: Game) -> GameRecord:
+    """ Record of a game from its history, usually once it is over. """
+    return GameRecord(seed=game.seed, turns=list(game.history),
+                      final_racks=[tuple(_rack.letters) for _rack in game.racks], scores=list(game.scores))
+
+
+def _letter_code(letter: str) -> int:
+    if letter == " ":
+        return 0
+    return LETTER_INDEX[letter.upper()] + 1 + (26 if letter.islower() else 0)
+
+
+_CODE_LETTERS = [" "] + ALPHABET[:26] + [_letter.lower() for _letter in ALPHABET[:26]]
+
+
+def _encode_letters(letters: Sequence[str]) -> bytes:
+    return bytes([len(letters)] + [_letter_code(_letter) for _letter in letters])
+
+
+def encode_record(record: GameRecord) -> bytes:
+    """ Body of a record in the layout above, without its length. """
+    _parts = [_GAME_HEADER.pack(record.seed if record.seed is not None else 0, record.seed is not None,
+                                record.nr_players, len(record.turns)),
+              struct.pack(f'<{record.nr_players}h', *record.scores)]
+    _parts += [_encode_letters(letters=_rack) for _rack in record.final_racks]
+    for _turn in record.turns:
+        _nr_items = len(_turn.tiles) if _turn.kind == TURN_PLAY else len(_turn.exchanged)
+        _parts.append(_TURN_HEADER.pack(_turn.kind, _nr_items, _turn.score))
+        _parts.append(_encode_letters(letters=_turn.rack))
+        if _turn.kind == TURN_PLAY:
+            _parts.append(bytes([_value for _row, _col, _letter in _turn.tiles
+                                 for _value in (int(_row) * BOARD_SIZE + int(_col), _letter_code(_letter))]))
+        elif _turn.kind == TURN_EXCHANGE:
+            _parts.append(bytes([_letter_code(_letter) for _letter in _turn.exchanged]))
+    return b''.join(_parts)
+
+
+def decode_record(body: bytes) -> GameRecord:
+    _seed, _seeded, _nr_players, _nr_turns = _GAME_HEADER.unpack_from(body, 0)
+    _offset = _GAME_HEADER.size
+    _scores = list(struct.unpack_from(f'<{_nr_players}h', body, _offset))
+    _offset += 2 * _nr_players
+
+    def letters() -> Tuple[str, ...]:
+        nonlocal _offset
+        _length = body[_offset]
+        _letters = tuple([_CODE_LETTERS[_code] for _code in body[_offset + 1:_offset + 1 + _length]])
+        _offset += 1 + _length
+        return _letters
+
+    _final_racks = [letters() for _ in range(_nr_players)]
+    _turns = []
+    for _turn in range(_nr_turns):
+        _kind, _nr_items, _score = _TURN_HEADER.unpack_from(body, _offset)
+        _offset += _TURN_HEADER.size
+        _rack = letters()
+        _tiles, _exchanged = (), ()
+        if _kind == TURN_PLAY:
+            _data = body[_offset:_offset + 2 * _nr_items]
+            _tiles = tuple([(_data[_i] // BOARD_SIZE, _data[_i] % BOARD_SIZE, _CODE_LETTERS[_data[_i + 1]])
+                            for _i in range(0, len(_data), 2)])
+            _offset += 2 * _nr_items
+        elif _kind == TURN_EXCHANGE:
+            _exchanged = tuple([_CODE_LETTERS[_code] for _code in body[_offset:_offset + _nr_items]])
+            _offset += _nr_items
+        _turns.append(Turn(player=_turn % _nr_players, rack=_rack, kind=_kind, tiles=_tiles, exchanged=_exchanged,
+                           score=_score))
+    return GameRecord(seed=_seed if _seeded else None, turns=_turns, final_racks=_final_racks, scores=_scores)
+
+
+class GameRecordWriter:
+    """ Appends records to a record file, creating it if needed. Records are written as they
+    come, so a writer can stay open for a whole self-play run. A record cut off by an interrupted
+    writer is dropped when the file is opened again, so new records follow the last complete one. """
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._file: BinaryIO = open(path, "ab")
+        if self._file.tell() < _FILE_HEADER.size:
+            # New file, or one whose header was cut off
+            self._file.truncate(0)
+            self._file.write(_FILE_HEADER.pack(_MAGIC, _VERSION))
+        else:
+            _check_header(path=path)
+            self._file.truncate(_complete_length(path=path))
+        self.nr_records = 0
+
+    def write(self, record: GameRecord) -> None:
+        _body = encode_record(record=record)
+        self._file.write(_LENGTH.pack(len(_body)))
+        self._file.write(_body)
+        self.nr_records += 1
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> 'GameRecordWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def _check_header(path: str) -> None:
+    with open(path, "rb") as _file:
+        _magic, _version = _FILE_HEADER.unpack(_file.read(_FILE_HEADER.size))
+    assert _magic == _MAGIC, f'{path} is not a game record file.'
+    assert _version == _VERSION, f'{path} has record format version {_version}, expected {_VERSION}.'
+
+
+def _complete_length(path: str) -> int:
+    """ Size of the header and the complete records at the start of a record file. """
+    with open(path, "rb") as _file:
+        _end = _file.seek(0, os.SEEK_END)
+        _offset = _FILE_HEADER.size
+        _file.seek(_offset)
+        while True:
+            _length = _file.read(_LENGTH.size)
+            if len(_length) < _LENGTH.size or _offset + _LENGTH.size + _LENGTH.unpack(_length)[0] > _end:
+                return _offset
+            _offset += _LENGTH.size + _LENGTH.unpack(_length)[0]
+            _file.seek(_offset)
+
+
+def read_records(path: str) -> Iterator[GameRecord]:
+    """ Records of a file in the order they were written. One record is held at a time, so any
+        number of games can be read in constant memory. """
+    _check_header(path=path)
+    with open(path, "rb") as _file:
+        _file.seek(_FILE_HEADER.size)
+        while True:
+            _length = _file.read(_LENGTH.size)
+            if len(_length) < _LENGTH.size:
+                return
+            _body = _file.read(_LENGTH.unpack(_length)[0])
+            if len(_body) < _LENGTH.unpack(_length)[0]:
+                return  # Record cut off by an interrupted writer
+            yield decode_record(body=_body)
+
+
+def replay(record: GameRecord, dictionary: DAWG) -> Iterator[BoardState]:
+    """ Board after every turn of record. The same BoardState is updated in place and yielded
+        each time, copy it to keep a position. """
+    _board = BoardState()
+    for _turn in record.turns:
+        if _turn.kind == TURN_PLAY:
+            _board.place(tiles=list(_turn.tiles), dictionary=dictionary)
+        yield _board
+
+
+def board_after(record: GameRecord, turn: int, dictionary: DAWG) -> BoardState:
+    """ Board after turns 0 .. turn of record. """
+    _board = BoardState()
+    _board.place(tiles=[_tile for _turn in record.turns[:turn + 1] for _tile in _turn.tiles], dictionary=dictionary)
+    return _board
+
+
+def _main_word(grid: List[List[str]], tiles: Sequence[Tuple[int, int, str]]) -> Tuple[int, int, int, str]:
+    """ (row, col, direction, word) of the main word formed by tiles on grid (which holds the
+        tiles), letters that were on the board before shown as '.' like in GCG. """
+    _placed = {(_row, _col) for _row, _col, _ in tiles}
+    _rows = {_row for _row, _, _ in tiles}
+    _row, _col, _ = tiles[0]
+    _direction = ACROSS if len(_rows) == 1 else DOWN
+    if len(tiles) == 1:
+        # A single tile forms its main word along the direction with neighbours
+        _has_across = (_col > 0 and grid[_row][_col - 1]) or (_col < BOARD_SIZE - 1 and grid[_row][_col + 1])
+        _direction = ACROSS if _has_across else DOWN
+    _d_row, _d_col = (0, 1) if _direction == ACROSS else (1, 0)
+    _row, _col = min(_placed)
+    while _row - _d_row >= 0 and _col - _d_col >= 0 and grid[_row - _d_row][_col - _d_col]:
+        _row, _col = _row - _d_row, _col - _d_col
+    _start = (_row, _col)
+    _word = []
+    while _row < BOARD_SIZE and _col < BOARD_SIZE and grid[_row][_col]:
+        _word.append(grid[_row][_col] if (_row, _col) in _placed else ".")
+        _row, _col = _row + _d_row, _col + _d_col
+    return _start[0], _start[1], _direction, "".join(_word)
+
+
+def _gcg_rack(letters: Sequence[str]) -> str:
+    return "".join(sorted(letters, key=lambda _letter: LETTER_INDEX[_letter])).replace(" ", "?")
+
+
+def to_gcg(record: GameRecord, names: Sequence[str] = None) -> str:
+    """ Record in the GCG text format: squares as row number and column letter ('8H' across,
+        'H8' down), blanks as '?' on racks and lower case in words, letters played through as
+        '.', and the end of game rack adjustments last. """
+    if names is None:
+        names = [f'p{_player + 1}' for _player in range(record.nr_players)]
+    _lines = ["#character-encoding UTF-8"]
+    _lines += [f'#player{_player + 1} {_name} {_name}' for _player, _name in enumerate(names)]
+    if record.seed is not None:
+        _lines.append(f'#note seed {record.seed}')
+    _grid = [[""] * BOARD_SIZE for _ in range(BOARD_SIZE)]
+    _totals = [0] * record.nr_players
+    for _turn in record.turns:
+        _totals[_turn.player] += _turn.score
+        _prefix = f'>{names[_turn.player]}: {_gcg_rack(letters=_turn.rack)}'
+        if _turn.kind == TURN_PLAY:
+            for _row, _col, _letter in _turn.tiles:
+                _grid[_row][_col] = _letter
+            _row, _col, _direction, _word = _main_word(grid=_grid, tiles=_turn.tiles)
+            _square = f'{_row + 1}{chr(65 + _col)}' if _direction == ACROSS else f'{chr(65 + _col)}{_row + 1}'
+            _lines.append(f'{_prefix} {_square} {_word} +{_turn.score} {_totals[_turn.player]}')
+        elif _turn.kind == TURN_EXCHANGE:
+            _lines.append(f'{_prefix} -{_gcg_rack(letters=_turn.exchanged)} +0 {_totals[_turn.player]}')
+        else:
+            _lines.append(f'{_prefix} - +0 {_totals[_turn.player]}')
+    # Tiles left on the racks, the player who went out (if any) gains the others' tiles
+    _values = [sum([TILE_POINTS[_letter] for _letter in _rack]) for _rack in record.final_racks]
+    _went_out = [_player for _player, _rack in enumerate(record.final_racks) if not _rack]
+    for _player, _rack in enumerate(record.final_racks):
+        if _rack:
+            _totals[_player] -= _values[_player]
+            _lines.append(f'>{names[_player]}: {_gcg_rack(letters=_rack)} ({_gcg_rack(letters=_rack)}) '
+                          f'-{_values[_player]} {_totals[_player]}')
+            if _went_out:
+                _totals[_went_out[0]] += _values[_player]
+                _lines.append(f'>{names[_went_out[0]]}: ({_gcg_rack(letters=_rack)}) '
+                              f'+{_values[_player]} {_totals[_went_out[0]]}')
+    return "\n".join(_lines) + "\n"
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description="Summarizes a game record file or exports a game as GCG.")
+    _parser.add_argument("path", help="Game record file, e.g. written by SelfPlay.py --records.")
+    _parser.add_argument("--gcg", type=int, default=None, help="Print the game with this index as GCG.")
+    _args = _parser.parse_args()
+
+    _nr_games = _nr_turns = 0
+    for _index, _record in enumerate(read_records(path=_args.path)):
+        if _args.gcg == _index:
+            print(to_gcg(record=_record), end="")
+            break
+        _nr_games += 1
+        _nr_turns += len(_record.turns)
+    if _args.gcg is None:
+        print(f'{_nr_games} games, {_nr_turns} turns, {os.path.getsize(_args.path)} bytes')
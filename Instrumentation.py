@@ -0,0 +1,186 @@
+import cProfile
+import functools
+import importlib
+import os
+import sys
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# (module, class, method) of the timed hot paths, GUI ones are only timed when their module is loaded
+TIMED_METHODS = [("ScrabbleEnvironment", "Scrabble", "_handle_input"),
+                 ("ScrabbleEnvironment", "Scrabble", "_render"),
+                 ("Structures", "DAWG", "holds"),
+                 ("MoveGenerator", "MoveGenerator", "generate"),
+                 ("Engine", "Bag", "draw_counts"),
+                 ("Engine", "Game", "play")]
+_HEADLESS_MODULES = {"Structures", "MoveGenerator", "Engine"}
+
+
+class RollingStats:
+    """ Number of samples and total of everything recorded, percentiles over the last 'window' samples. """
+
+    def __init__(self, window: int = 1000) -> None:
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float) -> None:
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def percentiles(self, q: Tuple[float, ...] = (50, 90, 99)) -> List[float]:
+        if not self.samples:
+            return [0.0] * len(q)
+        return list(np.percentile(np.fromiter(self.samples, dtype=np.float64), q))
+
+
+class Instrumentation:
+    """ Opt-in timing of the hot paths in TIMED_METHODS. enable() replaces those methods on their
+    classes with timing wrappers and disable() puts the originals back, so nothing is measured
+    (and nothing costs) while disabled. Besides the call timings it records the wall time of every
+    frame (between _render calls) and every turn (between Game turn ends), and can profile a
+    window of turns with cProfile. """
+
+    def __init__(self, window: int = 1000) -> None:
+        self.window = window
+        self.stats: Dict[str, RollingStats] = {}
+        self.enabled = False
+        self.turn = 0
+        self._originals: List[Tuple[type, str, Callable]] = []
+        self._last_frame: Optional[float] = None
+        self._last_turn: Optional[float] = None
+        self._profile_turns: Optional[Tuple[int, int, str]] = None  # (first turn, last turn, path)
+        self._profiler: Optional[cProfile.Profile] = None
+
+    def _record(self, name: str, value: float) -> None:
+        _stats = self.stats.get(name)
+        if _stats is None:
+            _stats = self.stats[name] = RollingStats(window=self.window)
+        _stats.add(value)
+
+    def _timed(self, name: str, method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            _start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._record(name, time.perf_counter() - _start)
+        return wrapper
+
+    def _frame_end(self, method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            _result = method(*args, **kwargs)
+            _now = time.perf_counter()
+            if self._last_frame is not None:
+                self._record("frame", _now - self._last_frame)
+            self._last_frame = _now
+            return _result
+        return wrapper
+
+    def _turn_end(self, method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            _result = method(*args, **kwargs)
+            _now = time.perf_counter()
+            if self._last_turn is not None:
+                self._record("turn", _now - self._last_turn)
+            self._last_turn = _now
+            self.turn += 1
+            self._update_profiler()
+            return _result
+        return wrapper
+
+    def _patch(self, cls: type, name: str, wrapper: Callable) -> None:
+        self._originals.append((cls, name, cls.__dict__[name]))
+        setattr(cls, name, wrapper)
+
+    def enable(self) -> None:
+        """ Starts timing. Headless modules are imported if needed, GUI methods are only
+            timed if their module was imported before. """
+        if self.enabled:
+            return
+        for _module_name, _class_name, _method_name in TIMED_METHODS:
+            if _module_name in _HEADLESS_MODULES:
+                _module = importlib.import_module(_module_name)
+            elif _module_name in sys.modules:
+                _module = sys.modules[_module_name]
+            else:
+                continue
+            _class = getattr(_module, _class_name)
+            _timed = self._timed(f'{_class_name}.{_method_name}', _class.__dict__[_method_name])
+            if _method_name == "_render":
+                _timed = self._frame_end(_timed)
+            self._patch(_class, _method_name, _timed)
+        _game = importlib.import_module("Engine").Game
+        self._patch(_game, "_end_turn", self._turn_end(_game.__dict__["_end_turn"]))
+        self.enabled = True
+
+    def disable(self) -> None:
+        """ Restores the original methods and stops a running profile, dumping what it collected
+            so far (e.g. when the game ends before the last profiled turn). """
+        for _class, _name, _method in reversed(self._originals):
+            setattr(_class, _name, _method)
+        self._originals = []
+        if self._profiler is not None:
+            self._dump_profile()
+        self._last_frame = self._last_turn = None
+        self.enabled = False
+
+    def reset(self) -> None:
+        self.stats = {}
+        self.turn = 0
+
+    def profile_turns(self, first: int, nr_turns: int, path: str) -> None:
+        """ Profiles turns first .. first + nr_turns - 1 (counted from enable or reset) with cProfile
+            and dumps the stats to path, to be read with pstats or turned into a flamegraph
+            (e.g. with flameprof or snakeviz). """
+        self._profile_turns = (first, first + nr_turns - 1, path)
+        self._update_profiler()
+
+    def _update_profiler(self) -> None:
+        if self._profile_turns is None:
+            return
+        _first, _last, _path = self._profile_turns
+        if self._profiler is None and _first <= self.turn <= _last:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self._profiler is not None and self.turn > _last:
+            self._dump_profile()
+
+    def _dump_profile(self) -> None:
+        self._profiler.disable()
+        self._profiler.dump_stats(self._profile_turns[2])
+        self._profiler = None
+        self._profile_turns = None
+
+    def report(self) -> str:
+        """ Calls, total time and rolling p50/p90/p99 in milliseconds of every timed entry. """
+        _lines = [f'{"name":<32}{"calls":>10}{"total s":>10}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}']
+        for _name, _stats in sorted(self.stats.items()):
+            _p50, _p90, _p99 = [_value * 1000 for _value in _stats.percentiles()]
+            _lines.append(f'{_name:<32}{_stats.count:>10}{_stats.total:>10.3f}{_p50:>10.3f}{_p90:>10.3f}{_p99:>10.3f}')
+        return "\n".join(_lines)
+
+
+INSTRUMENTATION = Instrumentation()
+
+
+def enable_from_environment() -> bool:
+    """ Enables INSTRUMENTATION if SCRABBLE_INSTRUMENT is set, and profiles a window of turns if
+        SCRABBLE_PROFILE_TURNS is set as 'first:count' (dumped to SCRABBLE_PROFILE_PATH,
+        'scrabble.prof' by default). Returns whether instrumentation was enabled. """
+    if not os.environ.get("SCRABBLE_INSTRUMENT"):
+        return False
+    INSTRUMENTATION.enable()
+    _turns = os.environ.get("SCRABBLE_PROFILE_TURNS")
+    if _turns:
+        _first, _count = [int(_value) for _value in _turns.split(":")]
+        INSTRUMENTATION.profile_turns(first=_first, nr_turns=_count,
+                                      path=os.environ.get("SCRABBLE_PROFILE_PATH", "scrabble.prof"))
+    return True
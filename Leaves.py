@@ -0,0 +1,199 @@
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import struct
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from Engine import *
+from Lexicon import *
+
+MAX_LEAVE_SIZE = HAND_SIZE - 1
+LEAVES_PATH = "Algorithm/leaves/leaves.bin"
+
+# _BINOMIALS[n][k] = n choose k
+_BINOMIALS = [[0] * (MAX_LEAVE_SIZE + 1) for _ in range(len(ALPHABET) + MAX_LEAVE_SIZE)]
+for _n in range(len(_BINOMIALS)):
+    _BINOMIALS[_n][0] = 1
+    for _k in range(1, min(_n, MAX_LEAVE_SIZE) + 1):
+        _BINOMIALS[_n][_k] = _BINOMIALS[_n - 1][_k - 1] + (_BINOMIALS[_n - 1][_k] if _k < _n else 0)
+# Index of the first leave of each size, the multisets of k letters kinds being (27 + k - 1 choose k)
+_SIZE_OFFSETS = list(itertools.accumulate([_BINOMIALS[len(ALPHABET) - 1 + _k][_k] for _k in range(MAX_LEAVE_SIZE + 1)],
+                                          initial=0))
+NR_LEAVES = _SIZE_OFFSETS[-1]
+
+
+def leave_rank(indices: Sequence[int]) -> int:
+    """ Index of the leave with the sorted LETTER_INDEX values 'indices' among all leaves of at most
+        MAX_LEAVE_SIZE tiles. A sorted multiset a_0 <= a_1 <= ... maps to the combination
+        a_i + i, which is ranked in the combinatorial number system. """
+    assert len(indices) <= MAX_LEAVE_SIZE, \
+        f'Leaves hold at most {MAX_LEAVE_SIZE} tiles, got {len(indices)}: a play places at least one tile.'
+    _rank = _SIZE_OFFSETS[len(indices)]
+    for _i, _index in enumerate(indices):
+        _rank += _BINOMIALS[_index + _i][_i + 1]
+    return _rank
+
+
+def leave_indices(letters: Sequence[str]) -> List[int]:
+    """ Sorted LETTER_INDEX values of letters, lower case letters being blanks. """
+    return sorted([BLANK_INDEX if _letter.islower() else LETTER_INDEX[_letter] for _letter in letters])
+
+
+def settings_fingerprint() -> str:
+    """ Hash of the settings leave values depend on, stored with every table. """
+    _settings = json.dumps([LETTER_DISTRIBUTION, POINT_DISTRIBUTION, HAND_SIZE, BINGO_BONUS], sort_keys=True)
+    return hashlib.sha256(_settings.encode()).hexdigest()
+
+
+class LeaveTable:
+    """ Value in points of every leave (the tiles kept on the rack after a play) of at most
+    MAX_LEAVE_SIZE tiles, looked up by leave_rank. """
+
+    _MAGIC = b'LEAV'
+    _HEADER = struct.Struct('=4sII64s')  # Magic, max leave size, number of leaves, settings fingerprint
+
+    def __init__(self, values: np.ndarray, fingerprint: str = None) -> None:
+        assert values.shape == (NR_LEAVES,), f'Expected {NR_LEAVES} values, got {values.shape}.'
+        self.values = values
+        self.fingerprint = fingerprint if fingerprint is not None else settings_fingerprint()
+
+    def value(self, letters: Sequence[str]) -> float:
+        """ Value of keeping letters, lower case letters being blanks. """
+        return float(self.values[leave_rank(indices=leave_indices(letters=letters))])
+
+    def move_values(self, rack: Sequence[str], moves: Sequence[Move]) -> np.ndarray:
+        """ Value of the leave of every move played from rack. """
+        _counts = rack_counts(rack)
+        _ranks = np.empty(shape=len(moves), dtype=np.int64)
+        for _m, _move in enumerate(moves):
+            _leave = list(_counts)
+            for _, _, _letter in _move.tiles:
+                _leave[BLANK_INDEX if _letter.islower() else LETTER_INDEX[_letter]] -= 1
+            _ranks[_m] = leave_rank(indices=[_index for _index, _count in enumerate(_leave) for _ in range(_count)])
+        return self.values[_ranks]
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as _file:
+            _file.write(self._HEADER.pack(self._MAGIC, MAX_LEAVE_SIZE, NR_LEAVES, self.fingerprint.encode()))
+            _file.write(self.values.astype(np.float32).tobytes())
+
+    @classmethod
+    def load(cls, path: str) -> 'LeaveTable':
+        """ Memory-maps a saved table, which has to be computed with the current settings. """
+        with open(path, "rb") as _file:
+            _magic, _max_size, _nr_leaves, _fingerprint = cls._HEADER.unpack(_file.read(cls._HEADER.size))
+        assert _magic == cls._MAGIC and _max_size == MAX_LEAVE_SIZE and _nr_leaves == NR_LEAVES, \
+            f'{path} does not hold a leave table.'
+        assert _fingerprint.decode() == settings_fingerprint(), \
+            f'{path} was computed for other letter or point distributions, recompute it with Leaves.py.'
+        _values = np.memmap(path, dtype=np.float32, mode="r", offset=cls._HEADER.size, shape=(NR_LEAVES,))
+        return cls(values=_values, fingerprint=_fingerprint.decode())
+
+
+def collect_samples(seed: int, dictionary: DAWG, table: LeaveTable = None) -> Tuple[np.ndarray, np.ndarray]:
+    """ Plays a seeded game, greedily or by score plus leave value if a table is given, and returns
+        for every play with a following turn of the same player the leave counts (ALPHABET order)
+        and the points that player scored next turn. """
+    _game = Game(dictionary=dictionary, seed=seed)
+    _turns = []  # (player, leave counts or None for a pass, score)
+    while not _game.is_over:
+        _player, _rack = _game.current_player, list(_game.current_rack.letters)
+        _moves = _game.legal_moves()
+        if not _moves:
+            # A pass leaves no tiles behind, it only counts as a scoreless next turn of an earlier play
+            _turns.append((_player, None, 0))
+            _game.pass_turn()
+            continue
+        _equities = _game.score_moves(moves=_moves).astype(np.float64)
+        if table is not None:
+            _equities += table.move_values(rack=_rack, moves=_moves)
+        _move = _moves[int(np.argmax(_equities))]
+        _leave = rack_counts(_rack)
+        for _, _, _letter in _move.tiles:
+            _leave[BLANK_INDEX if _letter.islower() else LETTER_INDEX[_letter]] -= 1
+        _result = _game.play_move(move=_move)
+        _turns.append((_player, _leave, _result.score))
+
+    _leaves, _next_scores = [], []
+    for _t, (_player, _leave, _) in enumerate(_turns):
+        _next = next((_score for _p, _, _score in _turns[_t + 1:] if _p == _player), None)
+        if _leave is not None and _next is not None:
+            _leaves.append(_leave)
+            _next_scores.append(_next)
+    return np.array(_leaves, dtype=np.int8).reshape(-1, len(ALPHABET)), np.array(_next_scores, dtype=np.float64)
+
+
+def fit_leave_table(leaves: np.ndarray, next_scores: np.ndarray, prior_weight: float = 20.0) -> LeaveTable:
+    """ Leave values from (leave counts, next turn score) samples: the mean next turn score after a
+        leave relative to the mean over all samples, shrunk towards an additive prior (the sum of
+        per tile values fitted by least squares) with the weight of prior_weight samples, so rare
+        and unseen leaves fall back to the prior. """
+    _targets = next_scores - next_scores.mean()
+    _tile_values = np.linalg.lstsq(leaves.astype(np.float64), _targets, rcond=None)[0]
+
+    _ranks = np.array([leave_rank(indices=[_index for _index in range(len(ALPHABET)) for _ in range(_counts[_index])])
+                       for _counts in leaves.tolist()], dtype=np.int64)
+    _sums = np.bincount(_ranks, weights=_targets, minlength=NR_LEAVES)
+    _nr_samples = np.bincount(_ranks, minlength=NR_LEAVES)
+
+    _prior = np.empty(shape=NR_LEAVES, dtype=np.float64)
+    for _size in range(MAX_LEAVE_SIZE + 1):
+        for _indices in itertools.combinations_with_replacement(range(len(ALPHABET)), _size):
+            _prior[leave_rank(indices=_indices)] = sum([_tile_values[_index] for _index in _indices])
+    _values = (_sums + prior_weight * _prior) / (_nr_samples + prior_weight)
+    return LeaveTable(values=_values.astype(np.float32))
+
+
+_DEFAULT_TABLE: Optional[LeaveTable] = None
+
+
+def default_leave_table() -> LeaveTable:
+    """ Table saved at LEAVES_PATH, loaded once per process. """
+    global _DEFAULT_TABLE
+    if _DEFAULT_TABLE is None:
+        assert os.path.exists(LEAVES_PATH), f'No leave table at {LEAVES_PATH}, compute one with Leaves.py.'
+        _DEFAULT_TABLE = LeaveTable.load(path=LEAVES_PATH)
+    return _DEFAULT_TABLE
+
+
+# Lexicon and table of a worker process, set by _init_worker
+_DICTIONARY: Optional[DAWG] = None
+_TABLE: Optional[LeaveTable] = None
+
+
+def _init_worker(table_path: Optional[str]) -> None:
+    global _DICTIONARY, _TABLE
+    _DICTIONARY = get_lexicon()
+    _TABLE = LeaveTable.load(path=table_path) if table_path else None
+
+
+def _collect_seed(seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    return collect_samples(seed=seed, dictionary=_DICTIONARY, table=_TABLE)
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description="Computes leave values from self-play games.")
+    _parser.add_argument("--games", type=int, default=1000, help="Number of self-play games.")
+    _parser.add_argument("--seed", type=int, default=0, help="Seed of the first game.")
+    _parser.add_argument("--processes", type=int, default=None, help="Worker processes, one per core by default.")
+    _parser.add_argument("--prior-weight", type=float, default=20.0, help="Samples worth of the additive prior.")
+    _parser.add_argument("--from-table", help="Play the games with this leave table instead of greedily.")
+    _parser.add_argument("--output", default=LEAVES_PATH, help="Path of the computed table.")
+    _args = _parser.parse_args()
+
+    get_lexicon()  # Compiling the lexicon cache once up front
+    with multiprocessing.Pool(processes=_args.processes, initializer=_init_worker,
+                              initargs=(_args.from_table,)) as _pool:
+        _samples = _pool.map(_collect_seed, range(_args.seed, _args.seed + _args.games))
+    _leaves = np.concatenate([_leaves for _leaves, _ in _samples])
+    _next_scores = np.concatenate([_scores for _, _scores in _samples])
+    _table = fit_leave_table(leaves=_leaves, next_scores=_next_scores, prior_weight=_args.prior_weight)
+    _table.save(path=_args.output)
+    print(f'{len(_next_scores)} samples from {_args.games} games, '
+          f'{len(np.unique(_leaves, axis=0))} distinct leaves, saved to {_args.output}')
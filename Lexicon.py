@@ -0,0 +1,74 @@
+import hashlib
+import mmap
+import os
+from multiprocessing import shared_memory
+from typing import List
+
+from Structures import *
+
+WORDLIST_DIR = "Algorithm/word lists/"
+CACHE_DIR = "Algorithm/lexicon cache/"
+
+
+def read_wordlist(path: str) -> List[str]:
+    """ Reads a word list file with a two line header and one word per line. """
+    with open(path, "r") as _file:
+        _lines = _file.read().split("\n")[2:]
+    return [_line.strip() for _line in _lines if _line.strip()]
+
+
+def source_hash(path: str) -> str:
+    """ Hex digest of the word list file, used as key for the compiled image. """
+    with open(path, "rb") as _file:
+        return hashlib.sha256(_file.read()).hexdigest()
+
+
+def compile_lexicon(source_path: str, image_path: str) -> DAWG:
+    """ Builds the DAWG from a word list and writes its binary image to 'image_path'. """
+    _dawg = DAWG()
+    _dawg.add_strings(strings=sorted(read_wordlist(path=source_path)))
+    _image = _dawg.to_bytes()
+    # Writing to a temporary file first so concurrent processes never map a partial image
+    _temporary_path = f'{image_path}.{os.getpid()}.tmp'
+    with open(_temporary_path, "wb") as _file:
+        _file.write(_image)
+    os.replace(_temporary_path, image_path)
+    return _dawg
+
+
+def load_lexicon(image_path: str) -> DAWG:
+    """ Memory-maps a compiled image read-only, so the pages are shared by all processes
+        mapping the same file and nothing is parsed or allocated per node. """
+    with open(image_path, "rb") as _file:
+        _buffer = mmap.mmap(_file.fileno(), 0, access=mmap.ACCESS_READ)
+    return DAWG.from_buffer(buffer=_buffer)
+
+
+def get_lexicon(source_path: str = None, cache_dir: str = CACHE_DIR) -> DAWG:
+    """ Loads the lexicon for a word list, compiling it into the cache first if the
+        cache holds no image for the current contents of the word list. """
+    if source_path is None:
+        source_path = WORDLIST_DIR + os.listdir(WORDLIST_DIR)[0]
+    os.makedirs(cache_dir, exist_ok=True)
+    _image_path = os.path.join(cache_dir, source_hash(path=source_path)[:32] + ".dawg")
+    if not os.path.exists(_image_path):
+        compile_lexicon(source_path=source_path, image_path=_image_path)
+    return load_lexicon(image_path=_image_path)
+
+
+def share_lexicon(dictionary: DAWG) -> shared_memory.SharedMemory:
+    """ Copies the image of dictionary into a new shared memory segment that other processes
+        attach to by name with attach_lexicon. The creator has to close and unlink the segment
+        once no process uses it anymore. """
+    _image = dictionary.to_bytes()
+    _segment = shared_memory.SharedMemory(create=True, size=len(_image))
+    _segment.buf[:len(_image)] = _image
+    return _segment
+
+
+def attach_lexicon(name: str) -> DAWG:
+    """ Lexicon reading the shared memory segment 'name' in place, nothing is copied. """
+    # Child processes share the resource tracker of their parent, which unlinks the segment
+    # only if the creator did not; unrelated processes should attach while the creator lives
+    _segment = shared_memory.SharedMemory(name=name)
+    return DAWG.from_buffer(buffer=_segment.buf, owner=_segment)
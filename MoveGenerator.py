@@ -0,0 +1,368 @@
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+from Settings import *
+from Structures import *
+
+FULL_MASK = (1 << 26) - 1  # Every letter A-Z allowed
+
+_CODE_LETTERS = [""] + ALPHABET  # Board letter code -> letter
+
+
+class Move(NamedTuple):
+    """ A legal placement of tiles from a rack. Letters played with a blank are lower case. """
+    row: int  # Square of the first letter of the main word
+    col: int
+    direction: int  # ACROSS or DOWN
+    word: str  # Main word
+    tiles: Tuple[Tuple[int, int, str], ...]  # (row, col, letter) of every tile placed from the rack
+    words: Tuple[str, ...]  # Every word formed by the play in upper case, main word first
+
+
+def rack_counts(rack: Union[str, List[str]]) -> List[int]:
+    """ Number of tiles of each ALPHABET letter on a rack, blanks (" ") last. """
+    _counts = [0] * len(ALPHABET)
+    for _letter in rack:
+        _counts[LETTER_INDEX[_letter]] += 1
+    return _counts
+
+
+def perpendicular_parts(grid: List[List[int]], row: int, col: int, direction: int) -> Optional[Tuple[str, str]]:
+    """ Letters directly before and after square (row, col) perpendicular to 'direction',
+        i.e. the cross-word a tile placed there would join, None if there are no such letters. """
+    _size = len(grid)
+    _before, _after = [], []
+    if direction == ACROSS:
+        _r = row - 1
+        while _r >= 0 and grid[_r][col]:
+            _before.append(_CODE_LETTERS[grid[_r][col]])
+            _r -= 1
+        _r = row + 1
+        while _r < _size and grid[_r][col]:
+            _after.append(_CODE_LETTERS[grid[_r][col]])
+            _r += 1
+    else:
+        _c = col - 1
+        while _c >= 0 and grid[row][_c]:
+            _before.append(_CODE_LETTERS[grid[row][_c]])
+            _c -= 1
+        _c = col + 1
+        while _c < _size and grid[row][_c]:
+            _after.append(_CODE_LETTERS[grid[row][_c]])
+            _c += 1
+    if not _before and not _after:
+        return None
+    return "".join(reversed(_before)), "".join(_after)
+
+
+def cross_check(grid: List[List[int]], row: int, col: int, direction: int, dictionary: DAWG) -> int:
+    """ 26-bit mask of the letters that can be placed on the empty square (row, col) in a play
+        along 'direction' without forming an invalid perpendicular word (bit k = chr(65 + k)). """
+    _parts = perpendicular_parts(grid=grid, row=row, col=col, direction=direction)
+    if _parts is None:
+        return FULL_MASK
+    _prefix, _suffix = _parts
+    _node = dictionary.walk(node=dictionary.root, letters=_prefix)
+    if not _node:
+        return 0
+    _mask = 0
+    _candidates = dictionary.edge_masks[_node]
+    while _candidates:
+        _bit = _candidates & -_candidates
+        _candidates ^= _bit
+        _child = dictionary.walk(node=dictionary.transitions[_node * 27 + _bit.bit_length() - 1], letters=_suffix)
+        if _child and dictionary.terminal[_child]:
+            _mask |= _bit
+    return _mask
+
+
+def compute_cross_checks(letters: np.ndarray, dictionary: DAWG) -> np.ndarray:
+    """ Cross-check masks of every square for both directions, shape (2, rows, cols).
+        Occupied squares get mask 0. """
+    _grid = letters.tolist()
+    _size = len(_grid)
+    _cross_checks = np.full((2, _size, _size), FULL_MASK, dtype=np.uint32)
+    for _row in range(_size):
+        for _col in range(_size):
+            if _grid[_row][_col]:
+                _cross_checks[:, _row, _col] = 0
+                continue
+            for _direction in (ACROSS, DOWN):
+                _cross_checks[_direction, _row, _col] = cross_check(grid=_grid, row=_row, col=_col,
+                                                                    direction=_direction, dictionary=dictionary)
+    return _cross_checks
+
+
+def update_cross_checks(letters: np.ndarray, cross_checks: np.ndarray,
+                        coordinates: List[Tuple[int, int]], dictionary: DAWG) -> List[Tuple[int, int]]:
+    """ Updates 'cross_checks' in place after tiles were placed on (or removed from) 'coordinates'.
+        Only the changed squares and the empty squares ending the lines of tiles through them
+        can get a different mask, so the rest of the board is left untouched. Returns those squares. """
+    _grid = letters.tolist()
+    _size = len(_grid)
+    _squares = set()
+    for _row, _col in coordinates:
+        _squares.add((_row, _col))
+        for _d_row, _d_col in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            _r, _c = _row + _d_row, _col + _d_col
+            while 0 <= _r < _size and 0 <= _c < _size and _grid[_r][_c]:
+                _r, _c = _r + _d_row, _c + _d_col
+            if 0 <= _r < _size and 0 <= _c < _size:
+                _squares.add((_r, _c))
+    for _row, _col in _squares:
+        if _grid[_row][_col]:
+            cross_checks[:, _row, _col] = 0
+            continue
+        for _direction in (ACROSS, DOWN):
+            cross_checks[_direction, _row, _col] = cross_check(grid=_grid, row=_row, col=_col,
+                                                               direction=_direction, dictionary=dictionary)
+    return list(_squares)
+
+
+def find_anchors(grid: List[List[int]]) -> List[List[bool]]:
+    """ Empty squares next to a tile, only the center square on an empty board. """
+    _size = len(grid)
+    _anchors = [[False] * _size for _ in range(_size)]
+    _any_tile = False
+    for _row in range(_size):
+        for _col in range(_size):
+            if grid[_row][_col]:
+                _any_tile = True
+                continue
+            if ((_row > 0 and grid[_row - 1][_col]) or (_row < _size - 1 and grid[_row + 1][_col]) or
+                    (_col > 0 and grid[_row][_col - 1]) or (_col < _size - 1 and grid[_row][_col + 1])):
+                _anchors[_row][_col] = True
+    if not _any_tile:
+        _anchors[_size // 2][_size // 2] = True
+    return _anchors
+
+
+def line_anchors(grid: List[List[int]], index: int, direction: int) -> List[bool]:
+    """ Anchors (see find_anchors) along row 'index' for ACROSS or column 'index' for DOWN. """
+    _size = len(grid)
+    _anchors = [False] * _size
+    for _pos in range(_size):
+        _row, _col = (index, _pos) if direction == ACROSS else (_pos, index)
+        if grid[_row][_col]:
+            continue
+        if ((_row > 0 and grid[_row - 1][_col]) or (_row < _size - 1 and grid[_row + 1][_col]) or
+                (_col > 0 and grid[_row][_col - 1]) or (_col < _size - 1 and grid[_row][_col + 1])):
+            _anchors[_pos] = True
+    if index == _size // 2 and not any(_anchors) and not any(map(any, grid)):
+        _anchors[_size // 2] = True
+    return _anchors
+
+
+def fits_rack(move: Move, counts: List[int]) -> bool:
+    """ Whether the tiles of move can be taken from a rack with ALPHABET 'counts', lower case
+        letters taking a blank. """
+    _used = [0] * len(ALPHABET)
+    for _, _, _letter in move.tiles:
+        _index = BLANK_INDEX if _letter.islower() else LETTER_INDEX[_letter]
+        _used[_index] += 1
+        if _used[_index] > counts[_index]:
+            return False
+    return True
+
+
+class _Line:
+    """ Rack independent data of one board line for MoveGenerator: its letter codes, anchors,
+    cross-checks and the perpendicular letters around the anchors, together with the moves
+    found on it for recent racks. """
+
+    def __init__(self, grid: List[List[int]], cross_checks: np.ndarray, index: int, direction: int) -> None:
+        self.index = index
+        self.direction = direction
+        self.line = grid[index] if direction == ACROSS else [_row[index] for _row in grid]
+        self.anchors = line_anchors(grid=grid, index=index, direction=direction)
+        self.has_anchors = any(self.anchors)
+        self.checks = (cross_checks[ACROSS, index] if direction == ACROSS else cross_checks[DOWN, :, index]).tolist()
+        # Perpendicular letters around the anchors, a tile with neighbours there forms a cross-word
+        self.parts = [None] * len(self.line)
+        for _pos, _anchor in enumerate(self.anchors):
+            if _anchor:
+                _row, _col = (index, _pos) if direction == ACROSS else (_pos, index)
+                self.parts[_pos] = perpendicular_parts(grid=grid, row=_row, col=_col, direction=direction)
+        self.moves: List[Tuple[List[int], List[Move]]] = []  # (rack counts, moves), most recent first
+
+
+class MoveGenerator:
+    """ Generates every legal play for a board and a rack with the anchor based algorithm of
+    Appel & Jacobson, 'The World's Fastest Scrabble Program' (1988), walking the DAWG lexicon:
+    for each anchor square a left part is built from the rack (or taken from the tiles already
+    left of the anchor) and extended rightwards through the anchor while respecting the
+    cross-checks. Down plays are generated the same way on the transposed board.
+
+    Given the line versions of a board (see Engine.BoardState.line_versions) the lines are cached
+    across calls: anchors and cross-word letters are only recomputed for lines a play changed, and
+    the moves of an unchanged line are reused for the same rack or filtered from those of a rack
+    holding all its tiles (e.g. the previous rack of a player in an endgame search). """
+
+    MAX_CACHED_LINES = 4096
+    MAX_CACHED_RACKS = 8  # Per line
+
+    def __init__(self, dictionary: DAWG) -> None:
+        self.dictionary = dictionary
+        self._lines: Dict[Tuple[int, int, int, int], _Line] = OrderedDict()  # (size, direction, index, version)
+
+    def generate(self, letters: np.ndarray,
+                 rack: Union[str, List[str]],
+                 cross_checks: np.ndarray = None,
+                 line_versions: np.ndarray = None) -> List[Move]:
+        """ All legal plays for the board letter codes 'letters' (EMPTY for empty squares) and
+            'rack' (letters of ALPHABET, " " for a blank). 'cross_checks' of shape (2, rows, cols)
+            are computed from the board when not given. Lines are cached when 'line_versions' of
+            shape (2, rows) is given. """
+        if cross_checks is None:
+            cross_checks = compute_cross_checks(letters=letters, dictionary=self.dictionary)
+        _size = len(letters)
+        _versions = line_versions.tolist() if line_versions is not None else None
+        _counts = rack_counts(rack=rack)
+        _grid = None
+        _moves = []
+        for _direction in (ACROSS, DOWN):
+            for _index in range(_size):
+                _line = None
+                if _versions is not None:
+                    _key = (_size, _direction, _index, _versions[_direction][_index])
+                    _line = self._lines.get(_key)
+                    if _line is not None:
+                        self._lines.move_to_end(_key)
+                if _line is None:
+                    if _grid is None:
+                        _grid = letters.tolist()
+                    _line = _Line(grid=_grid, cross_checks=cross_checks, index=_index, direction=_direction)
+                    if _versions is not None:
+                        self._lines[_key] = _line
+                        if len(self._lines) > self.MAX_CACHED_LINES:
+                            self._lines.popitem(last=False)
+                if _line.has_anchors:
+                    _moves += self._line_moves(line=_line, counts=_counts)
+        return _moves
+
+    def _line_moves(self, line: _Line, counts: List[int]) -> List[Move]:
+        """ Moves on line for a rack with ALPHABET 'counts', from its cache if possible. """
+        for _cached_counts, _cached_moves in line.moves:
+            if _cached_counts == counts:
+                return _cached_moves
+        # Moves for a smaller rack are the moves of a larger one using only its tiles, in the same order
+        _moves = None
+        for _cached_counts, _cached_moves in line.moves:
+            if all(_cached >= _count for _cached, _count in zip(_cached_counts, counts)):
+                _moves = [_move for _move in _cached_moves if fits_rack(move=_move, counts=counts)]
+                break
+        if _moves is None:
+            _moves = []
+            self._generate_line(index=line.index, direction=line.direction, line=line.line, anchors=line.anchors,
+                                checks=line.checks, parts=line.parts, counts=list(counts), moves=_moves)
+        line.moves.insert(0, (counts, _moves))
+        del line.moves[self.MAX_CACHED_RACKS:]
+        return _moves
+
+    def _generate_line(self, index: int, direction: int,
+                       line: List[int], anchors: List[bool], checks: List[int],
+                       parts: List[Optional[Tuple[str, str]]],
+                       counts: List[int], moves: List[Move]) -> None:
+        transitions = self.dictionary.transitions
+        terminal = self.dictionary.terminal
+        edge_masks = self.dictionary.edge_masks
+        size = len(line)
+        rack_size = sum(counts)
+        # Letters worth trying at all, any letter when a blank is on the rack
+        rack_mask = FULL_MASK if counts[BLANK_INDEX] else sum(1 << _code for _code in range(26) if counts[_code])
+
+        placed = []  # (position, letter) of the tiles placed right of the left part
+
+        def record(start: int, word: str, left: str) -> None:
+            _tiles = [(start + _offset, _letter) for _offset, _letter in enumerate(left)] + placed
+            # A single tile forming words both ways is already found as an across play
+            if direction == DOWN and len(_tiles) == 1 and parts[_tiles[0][0]] is not None:
+                return
+            _words = [word.upper()]
+            for _pos, _letter in _tiles:
+                if parts[_pos] is not None:
+                    _words.append(parts[_pos][0] + _letter.upper() + parts[_pos][1])
+            if direction == ACROSS:
+                moves.append(Move(index, start, ACROSS, word,
+                                  tuple((index, _pos, _letter) for _pos, _letter in _tiles), tuple(_words)))
+            else:
+                moves.append(Move(start, index, DOWN, word,
+                                  tuple((_pos, index, _letter) for _pos, _letter in _tiles), tuple(_words)))
+
+        def extend_right(node: int, pos: int, anchor: int, start: int, word: str, left: str) -> None:
+            if pos < size and line[pos]:
+                # Running through a tile already on the board
+                _child = transitions[node * 27 + line[pos] - 1]
+                if _child:
+                    extend_right(_child, pos + 1, anchor, start, word + _CODE_LETTERS[line[pos]], left)
+                return
+            if pos > anchor and terminal[node]:
+                record(start, word, left)
+            if pos == size:
+                return
+            _allowed = edge_masks[node] & checks[pos] & rack_mask
+            while _allowed:
+                _bit = _allowed & -_allowed
+                _allowed ^= _bit
+                _code = _bit.bit_length() - 1
+                _child = transitions[node * 27 + _code]
+                _letter = ALPHABET[_code]
+                if counts[_code]:
+                    counts[_code] -= 1
+                    placed.append((pos, _letter))
+                    extend_right(_child, pos + 1, anchor, start, word + _letter, left)
+                    placed.pop()
+                    counts[_code] += 1
+                if counts[BLANK_INDEX]:
+                    counts[BLANK_INDEX] -= 1
+                    placed.append((pos, _letter.lower()))
+                    extend_right(_child, pos + 1, anchor, start, word + _letter.lower(), left)
+                    placed.pop()
+                    counts[BLANK_INDEX] += 1
+
+        def left_part(node: int, limit: int, anchor: int, left: str) -> None:
+            extend_right(node, anchor, anchor, anchor - len(left), left, left)
+            if not limit:
+                return
+            # Squares left of the anchor without neighbours, so no cross-checks apply
+            _allowed = edge_masks[node] & rack_mask
+            while _allowed:
+                _bit = _allowed & -_allowed
+                _allowed ^= _bit
+                _code = _bit.bit_length() - 1
+                _child = transitions[node * 27 + _code]
+                _letter = ALPHABET[_code]
+                if counts[_code]:
+                    counts[_code] -= 1
+                    left_part(_child, limit - 1, anchor, left + _letter)
+                    counts[_code] += 1
+                if counts[BLANK_INDEX]:
+                    counts[BLANK_INDEX] -= 1
+                    left_part(_child, limit - 1, anchor, left + _letter.lower())
+                    counts[BLANK_INDEX] += 1
+
+        root = self.dictionary.root
+        for _anchor in range(size):
+            if not anchors[_anchor]:
+                continue
+            if _anchor > 0 and line[_anchor - 1]:
+                # Left part is the tiles already on the board before the anchor
+                _start = _anchor - 1
+                while _start > 0 and line[_start - 1]:
+                    _start -= 1
+                _node = root
+                for _pos in range(_start, _anchor):
+                    _node = transitions[_node * 27 + line[_pos] - 1]
+                    if not _node:
+                        break
+                if _node:
+                    _prefix = "".join(_CODE_LETTERS[_code] for _code in line[_start:_anchor])
+                    extend_right(_node, _anchor, _anchor, _start, _prefix, "")
+            else:
+                # Left part from the rack over the empty non-anchor squares before the anchor
+                _limit = 0
+                while _limit < _anchor and not anchors[_anchor - _limit - 1]:
+                    _limit += 1
+                left_part(root, min(_limit, rack_size - 1), _anchor, "")
@@ -0,0 +1,109 @@
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from MoveGenerator import *
+from Settings import *
+
+_LETTER_MULTIPLIER_VALUES = {"DLS": 2, "TLS": 3}
+_WORD_MULTIPLIER_VALUES = {"DWS": 2, "TWS": 3}
+
+# Points of a tile by letter, blanks (lower case or " ") are worth nothing
+TILE_POINTS = {**POINT_DISTRIBUTION, **{_letter.lower(): 0 for _letter in ALPHABET}}
+# Points of a board letter code (see Settings.EMPTY), played blanks are masked out separately
+CODE_POINTS = np.array([0] + [POINT_DISTRIBUTION[_letter] for _letter in ALPHABET[:26]], dtype=np.int32)
+
+
+def premium_matrices(size: int = BOARD_SIZE) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Letter multiplier, word multiplier and cell type (e.g. "DLS" or "STANDARD") of every
+        square, built from Settings.MULTIPLIER_ARRANGEMENT. """
+    _letter_multipliers = np.ones(shape=(size, size), dtype=np.int32)
+    _word_multipliers = np.ones(shape=(size, size), dtype=np.int32)
+    _types = np.full(shape=(size, size), fill_value="STANDARD", dtype=object)
+    for _type, _coordinates in MULTIPLIER_ARRANGEMENT.items():
+        for _row, _col in _coordinates:
+            _letter_multipliers[_row, _col] = _LETTER_MULTIPLIER_VALUES.get(_type, 1)
+            _word_multipliers[_row, _col] = _WORD_MULTIPLIER_VALUES.get(_type, 1)
+            _types[_row, _col] = _type
+    return _letter_multipliers, _word_multipliers, _types
+
+
+LETTER_MULTIPLIERS, WORD_MULTIPLIERS, PREMIUM_TYPES = premium_matrices()
+# Premium of every square as 0 for "STANDARD" or 1 + index in Settings.MULTIPLIER_TYPES
+PREMIUM_CODES = np.array([[0 if _type == "STANDARD" else MULTIPLIER_TYPES.index(_type) + 1 for _type in _row]
+                          for _row in PREMIUM_TYPES], dtype=np.uint8)
+
+
+def board_values(letters: np.ndarray, blanks: np.ndarray) -> np.ndarray:
+    """ Points of the tile on every square, 0 for empty squares and blanks. """
+    return np.where(blanks, 0, CODE_POINTS[letters])
+
+
+def perpendicular_sums(values: np.ndarray, occupied: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ For every square: the points of the tiles directly above and below it in contiguous runs,
+        and whether it has such a tile, i.e. whether a tile placed there by an across play forms
+        a down cross-word. Pass transposed arrays (and transpose the results) for down plays. """
+    _size = values.shape[0]
+    _above = np.zeros_like(values)
+    _below = np.zeros_like(values)
+    # Running sums that restart at every empty square
+    for _row in range(1, _size):
+        _above[_row] = np.where(occupied[_row - 1], values[_row - 1] + _above[_row - 1], 0)
+    for _row in range(_size - 2, -1, -1):
+        _below[_row] = np.where(occupied[_row + 1], values[_row + 1] + _below[_row + 1], 0)
+    _has_cross = np.zeros_like(occupied)
+    _has_cross[1:] |= occupied[:-1]
+    _has_cross[:-1] |= occupied[1:]
+    return _above + _below, _has_cross
+
+
+def score_moves(letters: np.ndarray, blanks: np.ndarray, moves: Sequence[Move]) -> np.ndarray:
+    """ Scores of a batch of legal moves on the board (letters, blanks) in one vectorized pass:
+        the main word from line prefix sums of the tiles on the board plus the placed tiles, every
+        cross-word from the perpendicular tile sums, premiums only under the placed tiles, blanks
+        worth nothing and the bingo bonus for playing a full rack. """
+    _nr_moves = len(moves)
+    if not _nr_moves:
+        return np.zeros(shape=0, dtype=np.int64)
+    _size = letters.shape[0]
+    assert LETTER_MULTIPLIERS.shape[0] == _size, f'Premium squares are defined for size {BOARD_SIZE}, not {_size}.'
+
+    _values = board_values(letters=letters, blanks=blanks)
+    _occupied = letters != EMPTY
+    # _prefix[direction, line, i] is the sum of the first i squares of the line
+    _prefix = np.zeros(shape=(2, _size, _size + 1), dtype=np.int64)
+    _prefix[ACROSS, :, 1:] = np.cumsum(_values, axis=1)
+    _prefix[DOWN, :, 1:] = np.cumsum(_values.T, axis=1)
+    _cross_sums = np.empty(shape=(2, _size, _size), dtype=np.int64)
+    _has_cross = np.empty(shape=(2, _size, _size), dtype=bool)
+    _cross_sums[ACROSS], _has_cross[ACROSS] = perpendicular_sums(values=_values, occupied=_occupied)
+    _sums, _has = perpendicular_sums(values=_values.T, occupied=_occupied.T)
+    _cross_sums[DOWN], _has_cross[DOWN] = _sums.T, _has.T
+
+    # Packing moves into flat arrays of placed tiles
+    _nr_tiles = np.fromiter((len(_move.tiles) for _move in moves), dtype=np.int64, count=_nr_moves)
+    _tiles = [_tile for _move in moves for _tile in _move.tiles]
+    _rows = np.fromiter((_tile[0] for _tile in _tiles), dtype=np.int64, count=len(_tiles))
+    _cols = np.fromiter((_tile[1] for _tile in _tiles), dtype=np.int64, count=len(_tiles))
+    _points = np.fromiter((TILE_POINTS[_tile[2]] for _tile in _tiles), dtype=np.int64, count=len(_tiles))
+    _directions = np.fromiter((_move.direction for _move in moves), dtype=np.int64, count=_nr_moves)
+    _starts = np.fromiter((_move.col if _move.direction == ACROSS else _move.row for _move in moves),
+                          dtype=np.int64, count=_nr_moves)
+    _lines = np.fromiter((_move.row if _move.direction == ACROSS else _move.col for _move in moves),
+                         dtype=np.int64, count=_nr_moves)
+    _lengths = np.fromiter((len(_move.word) for _move in moves), dtype=np.int64, count=_nr_moves)
+    _offsets = np.cumsum(_nr_tiles) - _nr_tiles
+    _tile_directions = np.repeat(_directions, _nr_tiles)
+
+    _letter_points = _points * LETTER_MULTIPLIERS[_rows, _cols]
+    _word_multipliers = WORD_MULTIPLIERS[_rows, _cols]
+
+    # Main word: tiles already on the line plus the placed tiles, times the placed word premiums
+    _on_board = _prefix[_directions, _lines, _starts + _lengths] - _prefix[_directions, _lines, _starts]
+    _main = (_on_board + np.add.reduceat(_letter_points, _offsets)) * np.multiply.reduceat(_word_multipliers, _offsets)
+
+    # Cross-words through each placed tile that touches tiles perpendicular to the play
+    _cross = np.where(_has_cross[_tile_directions, _rows, _cols],
+                      (_cross_sums[_tile_directions, _rows, _cols] + _letter_points) * _word_multipliers, 0)
+
+    return _main + np.add.reduceat(_cross, _offsets) + np.where(_nr_tiles == HAND_SIZE, BINGO_BONUS, 0)
@@ -1,12 +1,16 @@
+from Engine import *
 from GameObjects import *
+from Instrumentation import *
+from MoveGenerator import *
 from Util import *
+from VectorEnvironment import *
 
 
 class Scrabble:
+    """ Pygame view and controls of a headless Engine.Game. """
     def __init__(self, seed: int, display_gameplay: bool):
 
-        self.seed = seed
-        np.random.seed(self.seed)
+        self.seed = seed  # Determines all tile draws of the game
         self.display_gameplay = display_gameplay
 
         self.screen_color = WHITE  # white in RGB
@@ -21,15 +25,23 @@ class Scrabble:
             self.window_surface = pygame.display.set_mode(size=self.screen_size,
                                                           flags=pygame.DOUBLEBUF)
 
+        # Memory-mapped from the compiled lexicon cache (compiled on first use)
+        self.UK_dictionary = get_lexicon()
+        self.game = Game(dictionary=self.UK_dictionary, seed=self.seed)
+
         self.board = Board(nr_rows=self.rows,
                            nr_cols=self.columns,
                            board_size=(self.screen_width,
-                                       self.screen_width))
+                                       self.screen_width),
+                           state=self.game.board)
 
-        self.hand = Hand(hand_size=7,
+        self.hand = Hand(hand_size=HAND_SIZE,
                          UL_anchor=(0, 600),  # Pixel coordinate for upper left corner
                          background_width=self.screen_width,
-                         background_height=200)
+                         background_height=200,
+                         letters=self.game.current_rack.letters,
+                         # Stream of its own, so shuffling the hand does not change the tile draws of the game
+                         rng=np.random.default_rng(np.random.SeedSequence(self.seed).spawn(1)[0]))
 
         self.play = Play()
 
@@ -67,128 +79,210 @@ class Scrabble:
                                            height=30,
                                            text="Player 2")
 
-        self.UK_dictionary = Trie()
-        self.UK_dictionary.add_strings(strings=get_wordlist())
+        self._background = None  # Static window surface, rendered on the first frame
+        self._hovered = None  # (kind, key, button) of element under the mouse
 
         self.is_running = False
-        self.round = 0
 
-    def _render(self):
-        # Painting over previous frame
-        self.window_surface.fill(self.screen_color)
-        # Rendering grid
+    def _render_background(self) -> pygame.Surface:
+        """ Static parts of the window: the empty premium-square board and the hand background. """
+        _background = pygame.Surface(self.screen_size)
+        _background.fill(self.screen_color)
         for _row in range(self.rows):
             for _col in range(self.columns):
-                # Drawing cell fill color and edge color
-                draw_rect(surface=self.window_surface,
-                          color=self.board.grid[_row][_col].button.get_color(),
-                          rect=self.board.grid[_row][_col].button.rect,
+                _cell = self.board.grid[_row][_col]
+                draw_rect(surface=_background,
+                          color=_cell.button.un_highlighted_color,
+                          rect=_cell.button.rect,
                           border=1,
-                          border_color=self.board.grid[_row][_col].edge_color)
-        # Drawing multiplier text and content text
-        draw_text(surface=self.window_surface, cells=self.board.grid)
-
-        # Rendering hand
-        pygame.draw.rect(surface=self.window_surface,
+                          border_color=_cell.edge_color)
+                if _cell.get_type() != "STANDARD":
+                    _label = PygameText(text=_cell.get_type(),
+                                        text_size=_cell.text_size,
+                                        text_color=WHITE,
+                                        center_x=_cell.button.rect.centerx,
+                                        center_y=_cell.button.rect.centery)
+                    _background.blit(_label.text_surface, _label.text_rect)
+        pygame.draw.rect(surface=_background,
                          color=self.hand.background_color,
                          rect=self.hand.background_rect)
+        return _background
 
-        # Drawing cell fill color and edge color
-        for _letter in range(self.hand.hand_size):
-            draw_rect(surface=self.window_surface,
-                      color=self.hand.letter_cells[_letter].button.get_color(),
-                      rect=self.hand.letter_cells[_letter].button.rect,
-                      border=2,
-                      border_color=self.hand.letter_cells[_letter].edge_color)
-
-        # Drawing text in hand cells
-        draw_text(surface=self.window_surface, cells=self.hand.letter_cells)
-
-        # Drawing shuffle button
-        draw_button(surface=self.window_surface, button=self.shuffle_button)
-
-        # Drawing clear button
-        draw_button(surface=self.window_surface, button=self.clear_button)
+    def _draw_board_cell(self, cell: Cell) -> None:
+        # Empty and idle cells look exactly like the background
+        if not cell.is_occupied() and cell.button.get_color() == cell.button.un_highlighted_color:
+            self.window_surface.blit(self._background, cell.button.rect, area=cell.button.rect)
+        else:
+            draw_cell(surface=self.window_surface, cell=cell, border=1)
+        cell.button.dirty = False
 
-        # Drawing submit button
-        draw_button(surface=self.window_surface, button=self.submit_button)
+    def _draw_hand_cell(self, cell: Cell) -> None:
+        draw_cell(surface=self.window_surface, cell=cell, border=2)
+        cell.button.dirty = False
 
-        # Drawing pass button
-        draw_button(surface=self.window_surface, button=self.pass_button)
+    def _draw_widget(self, widget: Union[PygameButton, LabeledTile]) -> None:
+        draw_button(surface=self.window_surface, button=widget)
+        widget.dirty = False
 
-        # Draw Player tiles
-        draw_tile(surface=self.window_surface, tile=self.player_one_tile)
-        draw_tile(surface=self.window_surface, tile=self.player_two_tile)
+    def _render(self):
+        """ Redraws only the cells, hand slots, buttons and tiles whose state changed since the
+            last frame (restoring idle board cells from the cached background) and updates just
+            their rectangles on screen. The first frame draws and updates everything. """
+        _widgets = [self.shuffle_button, self.clear_button, self.submit_button, self.pass_button,
+                    self.player_one_tile, self.player_two_tile]
+        _full_redraw = self._background is None
+        if _full_redraw:
+            self._background = self._render_background()
+            self.window_surface.blit(self._background, (0, 0))
+
+        _dirty_rects = []
+        for _row in range(self.rows):
+            for _col in range(self.columns):
+                _cell = self.board.grid[_row][_col]
+                if _full_redraw or _cell.button.dirty:
+                    self._draw_board_cell(cell=_cell)
+                    _dirty_rects.append(_cell.button.rect)
+        for _cell in self.hand.letter_cells:
+            if _full_redraw or _cell.button.dirty:
+                self._draw_hand_cell(cell=_cell)
+                _dirty_rects.append(_cell.button.rect)
+        for _widget in _widgets:
+            if _full_redraw or _widget.dirty:
+                self._draw_widget(widget=_widget)
+                _dirty_rects.append(_widget.rect)
 
         # Updating screen and forcing specific framerate
-        pygame.display.update()
+        if _full_redraw:
+            pygame.display.update()
+        elif _dirty_rects:
+            pygame.display.update(_dirty_rects)
         self.clock.tick(self.fps)
 
-    # For handling user inputs
-    def _handle_input(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                self.is_running = False
-
-            # Checking if shuffle button is pressed
-            # TODO: Check MOUSEBUTTONDOWN smarter while still updating unpressed color
-            if self.shuffle_button.check_pressed(event=event):
-                self.hand.shuffle_hand()
-
-            # Checking if clear button is pressed
-            if self.clear_button.check_pressed(event=event):
-                # Returning letters from board to hand
+    def _element_at(self, position: Tuple[int, int]) -> Optional[Tuple[str, object, PygameButton]]:
+        """ (kind, key, button) of the element under a pixel position found by grid arithmetic,
+            kind being "board" (key (row, col)), "hand" (key slot index) or "button" (key button). """
+        _coordinate = self.board.cell_at(position=position)
+        if _coordinate is not None:
+            return "board", _coordinate, self.board.grid[_coordinate[0]][_coordinate[1]].button
+        _slot = self.hand.cell_at(position=position)
+        if _slot is not None:
+            # Only hand cells holding a letter react to the mouse
+            if self.hand.letter_cells[_slot].is_occupied():
+                return "hand", _slot, self.hand.letter_cells[_slot].button
+            return None
+        for _button in (self.shuffle_button, self.clear_button, self.submit_button, self.pass_button):
+            if _button.rect.collidepoint(position):
+                return "button", _button, _button
+        return None
+
+    def _set_hovered(self, element: Optional[Tuple[str, object, PygameButton]]) -> None:
+        """ Moves the highlight from the previously hovered element to element. """
+        if element == self._hovered:
+            return
+        if self._hovered is not None:
+            _kind, _key, _button = self._hovered
+            # Hand cells emptied meanwhile keep their empty color
+            if _kind != "hand" or self.hand.letter_cells[_key].is_occupied():
+                _button.set_highlighted(highlighted=False)
+        if element is not None:
+            element[2].set_highlighted(highlighted=True)
+        self._hovered = element
+
+    def _press(self, element: Tuple[str, object, PygameButton]) -> None:
+        _kind, _key, _button = element
+        # Checking if shuffle button is pressed
+        if _button is self.shuffle_button:
+            self.hand.shuffle_hand()
+
+        # Checking if clear button is pressed
+        elif _button is self.clear_button:
+            # Returning letters from board to hand
+            self.play.return_letters(board=self.board,
+                                     hand=self.hand)
+            update_hand_contents(hand=self.hand)
+
+        # Checking if submit button is pressed
+        elif _button is self.submit_button and not self.game.is_over:
+            # Checking the words formed by the play
+            _result = self.game.play(tiles=self.play.get_tiles(board=self.board))
+            if _result.valid:
+                print("Made legal play and found words:", _result.words, "score:", _result.score)
+                self.play.clear_play()
+                self.board.clear_pending()
+                # Showing rack of next player
+                self.hand.set_letters(letters=self.game.current_rack.letters)
+            else:
+                print("Invalid play:", _result.reason)
                 self.play.return_letters(board=self.board,
                                          hand=self.hand)
+            update_hand_contents(hand=self.hand)
+
+        # Checking if pass button is pressed
+        elif _button is self.pass_button and not self.game.is_over:
+            self.play.return_letters(board=self.board,
+                                     hand=self.hand)
+            self.game.pass_turn()
+            self.hand.set_letters(letters=self.game.current_rack.letters)
+            update_hand_contents(hand=self.hand)
+
+        # For handling buttons attached to board grid
+        elif _kind == "board":
+            _row, _col = _key
+            # Always setting pressed and un-pressing others
+            self.board.set_pressed(coordinate=(_row, _col))
+            # If hand cell was already marked -> move letter from hand to board
+            if self.hand.has_pressed:
+                # Squares already holding a tile do not take the letter and are not part of the play
+                if transfer_letter(hand_cell=self.hand.letter_cells[self.hand.pressed_coord],
+                                   board_cell=self.board.grid[_row][_col]):
+                    self.play.add_played_cell(board_coordinate=(_row, _col))
+                    self.board.toggle_pending(coordinate=(_row, _col), letter=self.board.grid[_row][_col].content.text)
                 update_hand_contents(hand=self.hand)
+                self.hand.has_pressed = False
 
-            # Checking if submit button is pressed
-            if self.submit_button.check_pressed(event=event):
-                # Checking that word exists in dictionary
-                if self.play.submit(round=self.round, board=self.board, dictionary=self.UK_dictionary):
-                    self.hand.refill_hand()
-                    self.round += 1
-                else:
-                    self.play.return_letters(board=self.board,
-                                             hand=self.hand)
-                update_hand_contents(hand=self.hand)
+        # For handling buttons attached to hand cells
+        elif _kind == "hand":
+            # Always setting pressed and un-pressing others
+            self.hand.set_pressed(coordinate=_key)
 
-            # For handling buttons attached to board grid
-            for _row in range(self.board.grid.shape[0]):
-                for _col in range(self.board.grid.shape[1]):
-                    if self.board.grid[_row][_col].button.check_pressed(event=event):
-                        # Always setting pressed and un-pressing others
-                        self.board.set_pressed(coordinate=(_row, _col))
-                        # If hand cell was already marked -> move letter from hand to board
-                        if self.hand.has_pressed:
-                            self.play.add_played_cell(
-                                letter_score=int(self.hand.letter_cells[self.hand.pressed_coord].score.text),
-                                board_coordinate=(_row, _col))
-                            transfer_letter(hand_cell=self.hand.letter_cells[self.hand.pressed_coord],
-                                            board_cell=self.board.grid[_row][_col])
-                            update_hand_contents(hand=self.hand)
-                            self.hand.has_pressed = False
-
-            # For handling buttons attached to hand cells
-            for _cell in range(len(self.hand.letter_cells)):
-                if self.hand.letter_cells[_cell].is_occupied():
-                    if self.hand.letter_cells[_cell].button.check_pressed(event=event):
-                        # Always setting pressed and un-pressing others
-                        self.hand.set_pressed(coordinate=_cell)
-        if self.round % 2 == 0:
+    # For handling user inputs
+    def _handle_input(self):
+        """ Dispatches each event to the single element under the cursor (see _element_at),
+            so the cost per event does not depend on the number of cells and buttons. """
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.is_running = False
+            elif event.type == pygame.MOUSEMOTION:
+                self._set_hovered(element=self._element_at(position=event.pos))
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                _element = self._element_at(position=event.pos)
+                self._set_hovered(element=_element)
+                if _element is not None:
+                    self._press(element=_element)
+        if self.game.current_player == 0:
             self.player_one_tile.set_highlighted()
             self.player_two_tile.highlighted = False
         else:
             self.player_two_tile.set_highlighted()
             self.player_one_tile.highlighted = False
 
-    def get_state(self):
-        pass
+    def get_legal_moves(self) -> List[Move]:
+        """ Every legal play of the player in turn. """
+        return self.game.legal_moves()
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        """ Arrays describing the game from the view of the player in turn, see VectorEnvironment.game_observation. """
+        return game_observation(game=self.game)
 
     # For running game
     def run(self):
+        # Opt-in timing of the hot paths, see Instrumentation.enable_from_environment
+        _instrumented = enable_from_environment()
         self.is_running = True
         while self.is_running:
             self._handle_input()
             self._render()
         pygame.quit()
+        if _instrumented:
+            print(INSTRUMENTATION.report())
+            INSTRUMENTATION.disable()
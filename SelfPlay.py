@@ -0,0 +1,201 @@
+import argparse
+import multiprocessing
+import random
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from Engine import *
+from GameRecords import *
+from Instrumentation import *
+from Leaves import *
+from Lexicon import *
+
+# A strategy picks the move to play from the legal moves and their scores, None to pass
+Strategy = Callable[[Game, List[Move], np.ndarray, random.Random], Optional[Move]]
+
+
+def greedy_strategy(game: Game, moves: List[Move], scores: np.ndarray, rng: random.Random) -> Optional[Move]:
+    """ Plays the highest scoring move. """
+    return moves[int(np.argmax(scores))] if moves else None
+
+
+def random_strategy(game: Game, moves: List[Move], scores: np.ndarray, rng: random.Random) -> Optional[Move]:
+    """ Plays a uniformly random legal move. """
+    return rng.choice(moves) if moves else None
+
+
+def equity_strategy(game: Game, moves: List[Move], scores: np.ndarray, rng: random.Random) -> Optional[Move]:
+    """ Plays the move with the highest score plus value of the kept tiles, see Leaves.default_leave_table. """
+    if not moves:
+        return None
+    _values = default_leave_table().move_values(rack=game.current_rack.letters, moves=moves)
+    return moves[int(np.argmax(scores + _values))]
+
+
+# Strategies by name, names are what is sent to the worker processes
+STRATEGIES: Dict[str, Strategy] = {"greedy": greedy_strategy,
+                                   "random": random_strategy,
+                                   "equity": equity_strategy}
+
+
+class GameSummary(NamedTuple):
+    """ Outcome of one self-play game. """
+    seed: int
+    scores: List[int]
+    nr_turns: int
+    winner: Optional[int]  # None on a tie
+    duration: float  # Seconds
+    record: Optional[GameRecord] = None  # Only when asked for, see run_self_play
+
+
+class SelfPlayReport(NamedTuple):
+    """ Throughput and score statistics of a self-play run. """
+    games: List[GameSummary]
+    duration: float  # Wall clock seconds of the whole run
+    nr_processes: int
+
+    @property
+    def games_per_second(self) -> float:
+        return len(self.games) / self.duration
+
+    @property
+    def turns_per_second(self) -> float:
+        return sum([_game.nr_turns for _game in self.games]) / self.duration
+
+    def scores(self) -> np.ndarray:
+        """ Final scores as a (games, players) array ordered by seed. """
+        return np.array([_game.scores for _game in sorted(self.games, key=lambda _game: _game.seed)])
+
+    def wins(self) -> List[int]:
+        """ Number of games won by each player. """
+        _wins = [0] * self.scores().shape[1]
+        for _game in self.games:
+            if _game.winner is not None:
+                _wins[_game.winner] += 1
+        return _wins
+
+    def summary(self) -> str:
+        _scores = self.scores()
+        _lines = [f'{len(self.games)} games in {self.duration:.2f}s on {self.nr_processes} processes: '
+                  f'{self.games_per_second:.2f} games/s, {self.turns_per_second:.1f} turns/s']
+        for _player, _wins in enumerate(self.wins()):
+            _p5, _p50, _p95 = np.percentile(_scores[:, _player], [5, 50, 95])
+            _lines.append(f'player {_player}: mean {_scores[:, _player].mean():.1f} '
+                          f'std {_scores[:, _player].std():.1f} p5/p50/p95 {_p5:.0f}/{_p50:.0f}/{_p95:.0f} '
+                          f'wins {_wins}')
+        return "\n".join(_lines)
+
+
+def play_game(seed: int, strategies: Sequence[str], dictionary: DAWG, record: bool = False) -> GameSummary:
+    """ Plays a game to the end, fully determined by its seed and the strategies of the players,
+        with its GameRecord if record is set. """
+    _start = time.perf_counter()
+    _game = Game(dictionary=dictionary, seed=seed, nr_players=len(strategies))
+    # Strategies draw from their own generator so they do not change the tile draws
+    _rng = random.Random(f'{seed}-strategies')
+    while not _game.is_over:
+        _moves = _game.legal_moves()
+        _move = STRATEGIES[strategies[_game.current_player]](_game, _moves, _game.score_moves(moves=_moves), _rng)
+        if _move is None:
+            _game.pass_turn()
+        else:
+            _game.play_move(move=_move)
+    return GameSummary(seed=seed, scores=list(_game.scores), nr_turns=_game.turn, winner=_game.winner(),
+                       duration=time.perf_counter() - _start, record=record_game(game=_game) if record else None)
+
+
+# Lexicon of a worker process, loaded once by _init_worker
+_DICTIONARY: Optional[DAWG] = None
+
+
+def _init_worker(source_path: Optional[str], segment_name: Optional[str] = None) -> None:
+    global _DICTIONARY
+    # Memory-mapped image or shared memory segment, so all workers share the same physical pages
+    if segment_name is not None:
+        _DICTIONARY = attach_lexicon(name=segment_name)
+    else:
+        _DICTIONARY = get_lexicon(source_path=source_path)
+
+
+def _play_seed(args) -> GameSummary:
+    _seed, _strategies, _record = args
+    return play_game(seed=_seed, strategies=_strategies, dictionary=_DICTIONARY, record=_record)
+
+
+def run_self_play(seeds: Sequence[int],
+                  strategies: Sequence[str] = ("greedy", "greedy"),
+                  nr_processes: int = None,
+                  source_path: str = None,
+                  chunksize: int = 1,
+                  share_memory: bool = False,
+                  record_path: str = None) -> SelfPlayReport:
+    """ Plays one game per seed across a pool of nr_processes worker processes (one per core by
+        default). Games are independent, so throughput scales with the number of cores. Workers
+        read the lexicon in place from the memory-mapped cache file, or with share_memory from a
+        shared memory segment (for when no cache file can be written). With record_path the
+        records of the games are appended to that file (see GameRecords) as they finish. """
+    for _strategy in strategies:
+        assert _strategy in STRATEGIES, f'Unknown strategy: {_strategy}, choose from {list(STRATEGIES)}.'
+    if nr_processes is None:
+        nr_processes = multiprocessing.cpu_count()
+    # Compiling the lexicon cache once up front instead of in every worker
+    _dictionary = get_lexicon(source_path=source_path)
+
+    _start = time.perf_counter()
+    _tasks = [(_seed, tuple(strategies), record_path is not None) for _seed in seeds]
+    _writer = GameRecordWriter(path=record_path) if record_path is not None else None
+
+    def collect(_summaries: Iterator[GameSummary]) -> List[GameSummary]:
+        # Records are written as games finish and not kept in the report
+        _games = []
+        for _summary in _summaries:
+            if _writer is not None:
+                _writer.write(record=_summary.record)
+                _summary = _summary._replace(record=None)
+            _games.append(_summary)
+        return _games
+
+    try:
+        if nr_processes == 1:
+            _init_worker(source_path=source_path)
+            _games = collect(map(_play_seed, _tasks))
+        else:
+            _segment = share_lexicon(dictionary=_dictionary) if share_memory else None
+            try:
+                with multiprocessing.Pool(processes=nr_processes, initializer=_init_worker,
+                                          initargs=(source_path, _segment.name if _segment else None)) as _pool:
+                    _games = collect(_pool.imap_unordered(_play_seed, _tasks, chunksize=chunksize))
+            finally:
+                if _segment is not None:
+                    _segment.close()
+                    _segment.unlink()
+    finally:
+        if _writer is not None:
+            _writer.close()
+    return SelfPlayReport(games=_games, duration=time.perf_counter() - _start, nr_processes=nr_processes)
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description="Runs seeded headless self-play games in parallel.")
+    _parser.add_argument("--games", type=int, default=100, help="Number of games.")
+    _parser.add_argument("--seed", type=int, default=0, help="Seed of the first game, games use consecutive seeds.")
+    _parser.add_argument("--processes", type=int, default=None, help="Worker processes, one per core by default.")
+    _parser.add_argument("--players", nargs="+", default=["greedy", "greedy"], choices=list(STRATEGIES),
+                         help="Strategy of each player.")
+    _parser.add_argument("--shared-memory", action="store_true",
+                         help="Share the lexicon with the workers through shared memory instead of the cache file.")
+    _parser.add_argument("--records", default=None, help="Append the records of the games to this file.")
+    _args = _parser.parse_args()
+    # Timings are collected in this process only, so only with --processes 1
+    _instrumented = enable_from_environment()
+    _report = run_self_play(seeds=range(_args.seed, _args.seed + _args.games),
+                            strategies=_args.players,
+                            nr_processes=_args.processes,
+                            share_memory=_args.shared_memory,
+                            record_path=_args.records)
+    print(_report.summary())
+    if _instrumented:
+        print(INSTRUMENTATION.report())
+        INSTRUMENTATION.disable()
@@ -46,6 +46,26 @@ ALPHABET = ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K",
             "L", "M", "N", "O", "P", "Q", "R", "S", "T", "U", "V",
             "W", "X", "Y", "Z", " "]
 
+# Index of each letter in ALPHABET, the blank tile " " is last (26)
+LETTER_INDEX = {_letter: _index for _index, _letter in enumerate(ALPHABET)}
+BLANK_INDEX = LETTER_INDEX[" "]
+
+# Number of rows and columns of the board
+BOARD_SIZE = 15
+
+# Number of tiles on a full hand (rack)
+HAND_SIZE = 7
+
+# Bonus for playing all tiles of a full hand in one turn
+BINGO_BONUS = 50
+
+# Board letter codes: 0 marks an empty square, ALPHABET[code - 1] is stored as code
+EMPTY = 0
+
+# Directions of a play
+ACROSS = 0
+DOWN = 1
+
 # Using https://en.wikipedia.org/wiki/Scrabble_letter_distributions
 LETTER_DISTRIBUTION = {
     " ": 2,  # 0 points
@@ -0,0 +1,198 @@
+import argparse
+import multiprocessing
+import time
+from collections import deque
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from Engine import *
+from Lexicon import *
+
+
+class CandidateStats(NamedTuple):
+    """ Rollout statistics of one candidate move. """
+    move: Move
+    score: int  # Static score of the move
+    mean: float  # Mean rollout value: score - opponent reply + own next move
+    stderr: float  # Standard error of the mean
+    nr_rollouts: int
+
+
+class SimulationResult(NamedTuple):
+    move: Optional[Move]  # Candidate with the highest mean, None if there is no legal move
+    candidates: List[CandidateStats]  # Ordered by mean, best first
+    nr_rollouts: int
+    duration: float  # Seconds
+
+    @property
+    def rollouts_per_second(self) -> float:
+        return self.nr_rollouts / self.duration if self.duration else 0.0
+
+
+def _letters(counts: Sequence[int]) -> List[str]:
+    return [_letter for _letter, _count in zip(ALPHABET, counts) for _ in range(_count)]
+
+
+def unseen_counts(game: Game) -> np.ndarray:
+    """ Tiles the player in turn cannot see (in the bag or on other racks) per ALPHABET letter,
+        i.e. the letter distribution minus the tiles on the board and on the own rack. """
+    _counts = np.array([LETTER_DISTRIBUTION[_letter] for _letter in ALPHABET], dtype=np.int64)
+    _board = game.board
+    _counts[:26] -= np.bincount(_board.letters[(_board.letters != EMPTY) & ~_board.blanks] - 1, minlength=26)
+    _counts[BLANK_INDEX] -= int(_board.blanks.sum())
+    _counts -= rack_counts(game.current_rack.letters)
+    return _counts
+
+
+def _best_reply(board: BoardState, rack: List[str], generator: MoveGenerator) -> Tuple[Optional[Move], int]:
+    _moves = generator.generate(letters=board.letters, rack=rack, cross_checks=board.cross_checks,
+                                line_versions=board.line_versions)
+    if not _moves:
+        return None, 0
+    _scores = score_moves(letters=board.letters, blanks=board.blanks, moves=_moves)
+    _best = int(np.argmax(_scores))
+    return _moves[_best], int(_scores[_best])
+
+
+def rollout(board: BoardState, rack: List[str], unseen: np.ndarray, move: Move, score: int,
+            generator: MoveGenerator, rng: np.random.Generator) -> float:
+    """ Plays move on a copy of board, samples the opponent's rack and the own refill from the
+        unseen tiles, lets the opponent make its best scoring reply and then the player its best
+        scoring next move. Returns score - opponent reply + own next move. """
+    _board = board.copy()
+    _board.place(tiles=list(move.tiles), dictionary=generator.dictionary)
+    _pool = unseen.copy()
+    _opponent = rng.multivariate_hypergeometric(_pool, min(HAND_SIZE, int(_pool.sum())), method="count")
+    _pool -= _opponent
+    _refill = rng.multivariate_hypergeometric(_pool, min(len(move.tiles), int(_pool.sum())), method="count")
+    _rack = list(rack)
+    for _, _, _letter in move.tiles:
+        _rack.remove(" " if _letter.islower() else _letter)
+
+    _reply, _reply_score = _best_reply(board=_board, rack=_letters(_opponent), generator=generator)
+    if _reply is not None:
+        _board.place(tiles=list(_reply.tiles), dictionary=generator.dictionary)
+    _, _next_score = _best_reply(board=_board, rack=_rack + _letters(_refill), generator=generator)
+    return score - _reply_score + _next_score
+
+
+# Move generator of a worker process, set by _init_worker
+_GENERATOR: Optional[MoveGenerator] = None
+
+
+def _init_worker(source_path: Optional[str]) -> None:
+    global _GENERATOR
+    _GENERATOR = MoveGenerator(dictionary=get_lexicon(source_path=source_path))
+
+
+def _run_rollouts(args) -> Tuple[int, List[float]]:
+    _index, _board, _rack, _unseen, _move, _score, _seed, _nr_rollouts = args
+    _rng = np.random.default_rng(_seed)
+    return _index, [rollout(board=_board, rack=_rack, unseen=_unseen, move=_move, score=_score,
+                            generator=_GENERATOR, rng=_rng) for _ in range(_nr_rollouts)]
+
+
+class Simulator:
+    """ Chooses moves by Monte Carlo simulation: the top_k highest scoring candidates are
+    evaluated with 2-ply rollouts (see rollout) spread over a pool of worker processes until a
+    wall clock budget is used up. Only the engine state (BoardState arrays, rack letters and
+    unseen tile counts) is sent to the workers. The pool is kept between turns, close() ends it. """
+
+    def __init__(self, top_k: int = 10,
+                 nr_processes: int = None,
+                 rollouts_per_task: int = 1,
+                 seed: int = 0,
+                 source_path: str = None) -> None:
+        self.top_k = top_k
+        self.nr_processes = nr_processes if nr_processes is not None else multiprocessing.cpu_count()
+        self.rollouts_per_task = rollouts_per_task
+        self._seeds = np.random.SeedSequence(seed)
+        get_lexicon(source_path=source_path)  # Compiling the lexicon cache once up front
+        if self.nr_processes == 1:
+            _init_worker(source_path=source_path)
+            self._pool = None
+        else:
+            self._pool = multiprocessing.Pool(processes=self.nr_processes, initializer=_init_worker,
+                                              initargs=(source_path,))
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self) -> 'Simulator':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def choose(self, game: Game, time_budget: float) -> SimulationResult:
+        """ Simulates the top candidates of the player in turn for about time_budget seconds. """
+        _start = time.perf_counter()
+        _moves = game.legal_moves()
+        if not _moves:
+            return SimulationResult(move=None, candidates=[], nr_rollouts=0, duration=time.perf_counter() - _start)
+        _scores = game.score_moves(moves=_moves)
+        _order = np.argsort(-_scores, kind="stable")[:self.top_k]
+        _candidates = [(_moves[_i], int(_scores[_i])) for _i in _order]
+        _values: List[List[float]] = [[] for _ in _candidates]
+        _board, _rack, _unseen = game.board, list(game.current_rack.letters), unseen_counts(game=game)
+
+        def task(_index: int) -> tuple:
+            _move, _score = _candidates[_index]
+            return (_index, _board, _rack, _unseen, _move, _score,
+                    self._seeds.spawn(1)[0], self.rollouts_per_task)
+
+        # Candidates are simulated round robin so all get a similar number of rollouts
+        _next = 0
+        if self._pool is None:
+            while time.perf_counter() - _start < time_budget or _next < len(_candidates):
+                _index, _results = _run_rollouts(task(_next % len(_candidates)))
+                _values[_index] += _results
+                _next += 1
+        else:
+            # One task per worker in flight, so the budget is overrun by at most one task
+            _pending = deque()
+            while _pending or time.perf_counter() - _start < time_budget or _next < len(_candidates):
+                while len(_pending) < self.nr_processes and \
+                        (time.perf_counter() - _start < time_budget or _next < len(_candidates)):
+                    _pending.append(self._pool.apply_async(_run_rollouts, (task(_next % len(_candidates)),)))
+                    _next += 1
+                _index, _results = _pending.popleft().get()
+                _values[_index] += _results
+
+        _stats = []
+        for (_move, _score), _value in zip(_candidates, _values):
+            _stderr = float(np.std(_value, ddof=1) / np.sqrt(len(_value))) if len(_value) > 1 else float("inf")
+            _stats.append(CandidateStats(move=_move, score=_score, mean=float(np.mean(_value)), stderr=_stderr,
+                                         nr_rollouts=len(_value)))
+        _stats.sort(key=lambda _candidate: -_candidate.mean)
+        return SimulationResult(move=_stats[0].move, candidates=_stats,
+                                nr_rollouts=sum([len(_value) for _value in _values]),
+                                duration=time.perf_counter() - _start)
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description="Plays a seeded game choosing every move by simulation.")
+    _parser.add_argument("--seed", type=int, default=0, help="Seed of the game.")
+    _parser.add_argument("--turns", type=int, default=4, help="Number of simulated turns.")
+    _parser.add_argument("--budget", type=float, default=2.0, help="Seconds per turn.")
+    _parser.add_argument("--top-k", type=int, default=10, help="Number of candidates simulated.")
+    _parser.add_argument("--processes", type=int, default=None, help="Worker processes, one per core by default.")
+    _args = _parser.parse_args()
+
+    _game = Game(dictionary=get_lexicon(), seed=_args.seed)
+    with Simulator(top_k=_args.top_k, nr_processes=_args.processes, seed=_args.seed) as _simulator:
+        for _ in range(_args.turns):
+            if _game.is_over:
+                break
+            _result = _simulator.choose(game=_game, time_budget=_args.budget)
+            if _result.move is None:
+                _game.pass_turn()
+                continue
+            _best = _result.candidates[0]
+            print(f'{_best.move.word} score {_best.score} value {_best.mean:.1f} +- {1.96 * _best.stderr:.1f} '
+                  f'({_result.nr_rollouts} rollouts in {_result.duration:.2f}s, {_result.rollouts_per_second:.1f}/s)')
+            _game.play_move(move=_result.move)
@@ -1,3 +1,7 @@
+import struct
+from array import array
+from typing import Iterator, List, Tuple, Union
+
 
 class Trie:
     """ Efficient structure for holding large sets of strings when doing many look-ups.
@@ -25,3 +29,264 @@ class Trie:
     def add_strings(self, strings):
         for string in strings:
             self.insert(word=string)
+
+
+class _DAWGBuildNode:
+    """ Node on the not yet minimized path of a DAWG under construction. """
+    __slots__ = ('edges', 'final')
+
+    def __init__(self):
+        self.edges = {}  # letter code -> _DAWGBuildNode (unchecked) or node index (minimized)
+        self.final = False
+
+
+# Byte -> letter code (A-Z -> 0-25), every other byte maps to the always empty column 26
+_LETTER_CODES = bytes(_byte - 65 if 65 <= _byte <= 90 else 26 for _byte in range(256))
+
+
+class DAWG:
+    """ Minimized, array-backed directed acyclic word graph holding the upper case words A-Z.
+    Words are added in one pass in sorted order and equal suffixes are shared, see:
+    https://en.wikipedia.org/wiki/Deterministic_acyclic_finite_state_automaton
+    and Daciuk et al. 'Incremental construction of minimal acyclic finite-state automata' (2000).
+
+    Node i owns the row transitions[27 * i: 27 * i + 27] holding the child index for each letter
+    code (0 = no edge, column 26 is always empty), terminal[i] marks the end of a word and
+    edge_masks[i] has bit k set when the node has an edge for letter chr(65 + k).
+    Node 0 is a dead node without edges. """
+
+    ROW_SIZE = 27
+
+    def __init__(self):
+        self.transitions = array('i', [0] * self.ROW_SIZE)
+        self.terminal = bytearray(1)
+        self.edge_masks = array('I', [0])
+        self._root = 0
+        self.nr_words = 0
+
+        self._register = {}
+        self._unchecked = []  # (parent, letter code, child) along the last inserted word
+        self._build_root = _DAWGBuildNode()
+        self._previous_word = ""
+        self._late_words = []  # Words inserted out of sorted order, merged on next finalize
+        self._sealed = False  # True once the build state has been frozen into the arrays
+        self._finalized = False
+        self._buffer = None  # Object owning the memory when the arrays are read in place
+
+    def insert(self, word: str) -> None:
+        assert word.isascii() and word.isalpha() and word.isupper(), f'Only words of letters A-Z are supported, got: {word}'
+        if self._sealed or word <= self._previous_word:
+            self._late_words.append(word)
+            self._finalized = False
+            return
+        # Minimizing the part of the previous word that is not shared with this one
+        _common = 0
+        for _a, _b in zip(word, self._previous_word):
+            if _a != _b:
+                break
+            _common += 1
+        self._minimize(down_to=_common)
+        _node = self._unchecked[-1][2] if self._unchecked else self._build_root
+        for letter in word[_common:]:
+            _child = _DAWGBuildNode()
+            _code = ord(letter) - 65
+            _node.edges[_code] = _child
+            self._unchecked.append((_node, _code, _child))
+            _node = _child
+        _node.final = True
+        self._previous_word = word
+        self.nr_words += 1
+
+    def add_strings(self, strings):
+        for string in strings:
+            self.insert(word=string)
+
+    def holds(self, word: str) -> bool:
+        if not self._finalized:
+            self._finalize()
+        transitions = self.transitions
+        node = self._root
+        for _code in word.encode().translate(_LETTER_CODES):
+            node = transitions[node * 27 + _code]
+            if not node:
+                return False
+        return self.terminal[node] == 1
+
+    @property
+    def root(self) -> int:
+        if not self._finalized:
+            self._finalize()
+        return self._root
+
+    def child(self, node: int, letter: str) -> int:
+        """ Index of node reached from 'node' by the letter A-Z 'letter', 0 if there is no such edge. """
+        return self.transitions[node * 27 + ord(letter) - 65]
+
+    def walk(self, node: int, letters: str) -> int:
+        """ Index of node reached from 'node' by following 'letters', 0 if the path does not exist. """
+        transitions = self.transitions
+        for _code in letters.encode().translate(_LETTER_CODES):
+            node = transitions[node * 27 + _code]
+            if not node:
+                return 0
+        return node
+
+    def children(self, node: int) -> Iterator[Tuple[str, int]]:
+        """ Iterates the (letter, child node) edges leaving 'node' in alphabetical order. """
+        _mask = self.edge_masks[node]
+        _row = node * 27
+        while _mask:
+            _code = (_mask & -_mask).bit_length() - 1
+            yield chr(65 + _code), self.transitions[_row + _code]
+            _mask &= _mask - 1
+
+    def is_terminal(self, node: int) -> bool:
+        return self.terminal[node] == 1
+
+    def words(self, max_length: int = None) -> List[str]:
+        """ All words (of at most 'max_length' letters) held in the graph in sorted order. """
+        if not self._finalized:
+            self._finalize()
+        return self._collect_words(max_length=max_length)
+
+    def _collect_words(self, max_length: int = None) -> List[str]:
+        _words = []
+        _stack = [(self._root, "")]
+        while _stack:
+            _node, _prefix = _stack.pop()
+            if self.terminal[_node]:
+                _words.append(_prefix)
+            if max_length is not None and len(_prefix) == max_length:
+                continue
+            _stack.extend(reversed([(_child, _prefix + _letter) for _letter, _child in self.children(_node)]))
+        return _words
+
+    @property
+    def nr_nodes(self) -> int:
+        return len(self.terminal)
+
+    # Binary image: header followed by transitions (int32), edge_masks (uint32) and terminal (uint8)
+    IMAGE_MAGIC = b'DAWG'
+    IMAGE_VERSION = 1
+    _IMAGE_HEADER = struct.Struct('=4sIIII')  # magic, version, nr_nodes, nr_words, root
+
+    def to_bytes(self) -> bytes:
+        """ Serializes the graph into the binary image read by DAWG.from_buffer. """
+        if not self._finalized:
+            self._finalize()
+        _header = self._IMAGE_HEADER.pack(self.IMAGE_MAGIC, self.IMAGE_VERSION,
+                                          self.nr_nodes, self.nr_words, self._root)
+        return b''.join([_header, self.transitions.tobytes(), self.edge_masks.tobytes(), bytes(self.terminal)])
+
+    @classmethod
+    def from_buffer(cls, buffer: Union[bytes, memoryview], owner: object = None) -> 'DAWG':
+        """ Graph reading its arrays in place from a binary image (e.g. a memory-mapped file),
+        no nodes are copied or allocated. The buffer has to stay alive as long as the graph,
+        the graph keeps a reference to owner (the buffer itself by default) to ensure that. """
+        _view = memoryview(buffer)
+        _magic, _version, _nr_nodes, _nr_words, _root = cls._IMAGE_HEADER.unpack_from(_view)
+        assert _magic == cls.IMAGE_MAGIC and _version == cls.IMAGE_VERSION, 'Buffer does not hold a DAWG image.'
+        assert array('i').itemsize == array('I').itemsize == 4, 'Images require 4 byte integers.'
+        _transitions_start = cls._IMAGE_HEADER.size
+        _masks_start = _transitions_start + 4 * cls.ROW_SIZE * _nr_nodes
+        _terminal_start = _masks_start + 4 * _nr_nodes
+
+        dawg = cls()
+        dawg.transitions = _view[_transitions_start:_masks_start].cast('i')
+        dawg.edge_masks = _view[_masks_start:_terminal_start].cast('I')
+        dawg.terminal = _view[_terminal_start:_terminal_start + _nr_nodes]
+        dawg.nr_words = _nr_words
+        dawg._root = _root
+        dawg._build_root = None
+        dawg._sealed = dawg._finalized = True
+        dawg._buffer = buffer if owner is None else owner
+        return dawg
+
+    def _minimize(self, down_to: int) -> None:
+        # Replacing unchecked nodes (deepest first) by an equivalent registered node
+        while len(self._unchecked) > down_to:
+            _parent, _code, _child = self._unchecked.pop()
+            _parent.edges[_code] = self._register_node(node=_child)
+
+    def _register_node(self, node: _DAWGBuildNode) -> int:
+        _key = (node.final, tuple(node.edges.items()))
+        _index = self._register.get(_key)
+        if _index is None:
+            _index = len(self.terminal)
+            _row = [0] * self.ROW_SIZE
+            _mask = 0
+            for _code, _child in node.edges.items():
+                _row[_code] = _child
+                _mask |= 1 << _code
+            self.transitions.extend(_row)
+            self.terminal.append(node.final)
+            self.edge_masks.append(_mask)
+            self._register[_key] = _index
+        return _index
+
+    def _finalize(self) -> None:
+        if not self._sealed:
+            self._minimize(down_to=0)
+            self._root = self._register_node(node=self._build_root)
+            # Build state is no longer needed once the graph is frozen
+            self._register = {}
+            self._build_root = None
+            self._sealed = True
+        if self._late_words:
+            # Rebuilding from scratch with the late words merged into the sorted word list
+            _words = sorted(set(self._collect_words()).union(self._late_words))
+            self.__init__()
+            self.add_strings(strings=_words)
+            self._finalize()
+        self._finalized = True
+
+
+class AnagramIndex:
+    """ Words of the letters A-Z grouped by their signature, the sorted multiset of their letters.
+    The signatures are held in a DAWG, so all words playable from a rack are found with one walk
+    over the sub-multisets of the rack, where a blank (" ") may stand for any letter. """
+
+    BLANK = " "
+
+    def __init__(self, words: List[str]):
+        self.max_length = 0
+        self._words_by_signature = {}
+        for _word in words:
+            self._words_by_signature.setdefault("".join(sorted(_word)), []).append(_word)
+            self.max_length = max(self.max_length, len(_word))
+        self.signatures = DAWG()
+        self.signatures.add_strings(strings=sorted(self._words_by_signature))
+
+    def anagrams(self, rack: str, min_length: int = 2) -> Iterator[Tuple[str, str]]:
+        """ Yields (word, letters played by blanks) for every word of at least 'min_length'
+            letters playable from 'rack', blanks only cover letters missing from the rack. """
+        _counts = [0] * 26
+        _blanks = 0
+        for _letter in rack:
+            if _letter == self.BLANK:
+                _blanks += 1
+            else:
+                _counts[ord(_letter) - 65] += 1
+        transitions, terminal, edge_masks = self.signatures.transitions, self.signatures.terminal, \
+            self.signatures.edge_masks
+
+        def walk(node: int, signature: str, blank_letters: str, blanks: int) -> Iterator[Tuple[str, str]]:
+            if terminal[node] and len(signature) >= min_length:
+                for _word in self._words_by_signature[signature]:
+                    yield _word, blank_letters
+            # Letters of a signature are sorted, so only edges with a letter >= the last one exist
+            _mask = edge_masks[node]
+            while _mask:
+                _bit = _mask & -_mask
+                _mask ^= _bit
+                _code = _bit.bit_length() - 1
+                _child = transitions[node * 27 + _code]
+                _letter = chr(65 + _code)
+                if _counts[_code]:
+                    _counts[_code] -= 1
+                    yield from walk(_child, signature + _letter, blank_letters, blanks)
+                    _counts[_code] += 1
+                elif blanks:
+                    yield from walk(_child, signature + _letter, blank_letters + _letter, blanks - 1)
+
+        yield from walk(self.signatures.root, "", "", _blanks)
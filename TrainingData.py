@@ -0,0 +1,302 @@
+import argparse
+import glob
+import json
+import multiprocessing.util
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from Engine import *
+from GameRecords import *
+from Lexicon import *
+import SelfPlay
+from SelfPlay import *
+
+TRAINING_DATA_PATH = "Algorithm/training data"
+CHUNK_SIZE = 1 << 16  # Samples per chunk file
+
+# One sample per turn: the position before the turn from the view of the player in turn (as in
+# VectorEnvironment.game_observation), the move played, its score and the final score margin
+SAMPLE_DTYPE = np.dtype([("letters", np.uint8, (BOARD_SIZE, BOARD_SIZE)),
+                         ("blanks", np.bool_, (BOARD_SIZE, BOARD_SIZE)),
+                         ("premiums", np.uint8, (BOARD_SIZE, BOARD_SIZE)),
+                         ("rack", np.uint8, (len(ALPHABET),)),  # Letter counts, blanks last
+                         ("scores", np.int16, (2,)),  # Scores before the turn
+                         ("bag_size", np.int16),
+                         ("current_player", np.int8),
+                         ("kind", np.int8),  # TURN_PLAY, TURN_EXCHANGE or TURN_PASS
+                         # (row, col, letter code) of the placed tiles, -1 padded; blanks as negative codes
+                         ("move", np.int8, (HAND_SIZE, 3)),
+                         ("score", np.int16),  # Points of the move
+                         ("outcome", np.int16),  # Final score of the player in turn minus the opponent's
+                         ("seed", np.int64),
+                         ("turn", np.int16)])
+_NR_TILES = sum(LETTER_DISTRIBUTION.values())
+
+
+def record_samples(record: GameRecord) -> np.ndarray:
+    """ SAMPLE_DTYPE sample of every turn of a two player game record, no lexicon needed. """
+    assert record.nr_players == 2, f'Samples are made from two player games, got {record.nr_players} players.'
+    _samples = np.zeros(shape=len(record.turns), dtype=SAMPLE_DTYPE)
+    _letters = np.zeros(shape=(BOARD_SIZE, BOARD_SIZE), dtype=np.uint8)
+    _blanks = np.zeros(shape=(BOARD_SIZE, BOARD_SIZE), dtype=bool)
+    _premiums = PREMIUM_CODES.copy()
+    _scores = [0, 0]
+    _bag_size = _NR_TILES - HAND_SIZE * 2
+    _samples["move"] = -1
+    _samples["seed"] = record.seed if record.seed is not None else -1
+    for _t, _turn in enumerate(record.turns):
+        _samples["letters"][_t] = _letters
+        _samples["blanks"][_t] = _blanks
+        _samples["premiums"][_t] = _premiums
+        _samples["rack"][_t] = rack_counts(_turn.rack)
+        _samples["scores"][_t] = _scores
+        _samples["bag_size"][_t] = _bag_size
+        _samples["current_player"][_t] = _turn.player
+        _samples["kind"][_t] = _turn.kind
+        _samples["score"][_t] = _turn.score
+        _samples["outcome"][_t] = record.scores[_turn.player] - record.scores[1 - _turn.player]
+        _samples["turn"][_t] = _t
+        for _i, (_row, _col, _letter) in enumerate(_turn.tiles):
+            _code = LETTER_INDEX[_letter.upper()] + 1
+            _samples["move"][_t, _i] = (_row, _col, -_code if _letter.islower() else _code)
+            _letters[_row, _col] = _code
+            _blanks[_row, _col] = _letter.islower()
+            _premiums[_row, _col] = 0
+        _scores[_turn.player] += _turn.score
+        if _turn.kind == TURN_PLAY:
+            _bag_size -= min(len(_turn.tiles), _bag_size)
+    return _samples
+
+
+class ChunkWriter:
+    """ Appends samples to the chunk files '<name>-<chunk>.npy' of a dataset directory, each
+    holding chunk_size samples (the last one fewer) in a .npy file written through a memory map,
+    and lists the finished chunks in the index '<name>.index.json'. Writers with different names
+    can append to the same directory at the same time, e.g. one per worker process. """
+
+    def __init__(self, directory: str, name: str, chunk_size: int = CHUNK_SIZE) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.name = name
+        self.chunk_size = chunk_size
+        self.chunks: List[Dict] = []  # Index entries: file name and number of samples
+        self.nr_samples = 0
+        self._chunk: Optional[np.memmap] = None
+        self._fill = 0
+
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.directory, file_name)
+
+    def append(self, samples: np.ndarray) -> None:
+        assert samples.dtype == SAMPLE_DTYPE, f'Expected samples of dtype SAMPLE_DTYPE, got {samples.dtype}.'
+        _start = 0
+        while _start < len(samples):
+            if self._chunk is None:
+                self._chunk = np.lib.format.open_memmap(
+                    self._path(f'{self.name}-{len(self.chunks):05d}.npy'), mode="w+", dtype=SAMPLE_DTYPE,
+                    shape=(self.chunk_size,))
+                self._fill = 0
+            _count = min(len(samples) - _start, self.chunk_size - self._fill)
+            self._chunk[self._fill:self._fill + _count] = samples[_start:_start + _count]
+            self._fill += _count
+            _start += _count
+            if self._fill == self.chunk_size:
+                self._finish_chunk()
+        self.nr_samples += len(samples)
+
+    def _finish_chunk(self) -> None:
+        _file_name = os.path.basename(self._chunk.filename)
+        if self._fill < self.chunk_size:
+            # The last chunk is rewritten with its actual length, so every chunk file is fully valid
+            _samples = np.array(self._chunk[:self._fill])
+            del self._chunk
+            np.save(self._path(_file_name), _samples)
+        else:
+            self._chunk.flush()
+            del self._chunk
+        self._chunk = None
+        self.chunks.append({"file": _file_name, "nr_samples": self._fill})
+        # Replaced atomically, so readers never see a half written index
+        _index_path = self._path(f'{self.name}.index.json')
+        with open(_index_path + ".tmp", "w") as _file:
+            json.dump({"dtype": str(SAMPLE_DTYPE.descr), "chunks": self.chunks}, _file)
+        os.replace(_index_path + ".tmp", _index_path)
+
+    def close(self) -> None:
+        if self._chunk is not None and self._fill:
+            self._finish_chunk()
+
+    def __enter__(self) -> 'ChunkWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class TrainingDataset:
+    """ Every chunk listed in the indexes of a dataset directory. Chunks are memory-mapped when
+    first read, so only the batches taken from them are loaded into RAM. """
+
+    def __init__(self, directory: str = TRAINING_DATA_PATH) -> None:
+        self.directory = directory
+        self.chunks: List[Tuple[str, int]] = []  # (path, number of samples)
+        for _index_path in sorted(glob.glob(os.path.join(glob.escape(directory), "*.index.json"))):
+            with open(_index_path) as _file:
+                _index = json.load(_file)
+            assert _index["dtype"] == str(SAMPLE_DTYPE.descr), \
+                f'{_index_path} holds samples of another layout, export them again.'
+            self.chunks += [(os.path.join(directory, _chunk["file"]), _chunk["nr_samples"])
+                            for _chunk in _index["chunks"]]
+        self._maps: List[Optional[np.ndarray]] = [None] * len(self.chunks)
+
+    def __len__(self) -> int:
+        return sum([_nr_samples for _, _nr_samples in self.chunks])
+
+    def chunk(self, index: int) -> np.ndarray:
+        if self._maps[index] is None:
+            self._maps[index] = np.load(self.chunks[index][0], mmap_mode="r")
+        return self._maps[index]
+
+    def batches(self, batch_size: int, shuffle: bool = True, seed: int = 0,
+                chunks_in_memory: int = 4, drop_last: bool = False) -> Iterator[np.ndarray]:
+        """ Batches of SAMPLE_DTYPE samples covering the dataset once. With shuffle the chunks are
+            visited in random order and the samples of chunks_in_memory chunks at a time are
+            shuffled together, so besides the batch only their sample indices are held in memory. """
+        _rng = np.random.default_rng(seed)
+        _order = _rng.permutation(len(self.chunks)) if shuffle else np.arange(len(self.chunks))
+        _carry_chunks, _carry_rows = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        for _start in range(0, len(_order), chunks_in_memory):
+            _group = _order[_start:_start + chunks_in_memory]
+            _chunks = np.concatenate([_carry_chunks] + [np.full(self.chunks[_c][1], _c) for _c in _group])
+            _rows = np.concatenate([_carry_rows] + [np.arange(self.chunks[_c][1]) for _c in _group])
+            if shuffle:
+                _permutation = _rng.permutation(len(_rows))
+                _chunks, _rows = _chunks[_permutation], _rows[_permutation]
+            _last = _start + chunks_in_memory >= len(_order)
+            _nr_full = len(_rows) // batch_size * batch_size
+            for _b in range(0, _nr_full, batch_size):
+                yield self._gather(chunks=_chunks[_b:_b + batch_size], rows=_rows[_b:_b + batch_size])
+            # Samples short of a full batch move on to the next group
+            _carry_chunks, _carry_rows = _chunks[_nr_full:], _rows[_nr_full:]
+            if _last and len(_carry_rows) and not drop_last:
+                yield self._gather(chunks=_carry_chunks, rows=_carry_rows)
+
+    def _gather(self, chunks: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        _batch = np.empty(shape=len(rows), dtype=SAMPLE_DTYPE)
+        for _c in np.unique(chunks).tolist():
+            _selected = chunks == _c
+            _batch[_selected] = self.chunk(index=_c)[rows[_selected]]
+        return _batch
+
+
+def export_records(record_path: str, directory: str, name: str = None, chunk_size: int = CHUNK_SIZE) -> int:
+    """ Writes the samples of every game in a record file (see GameRecords) to directory,
+        returns the number of samples. """
+    if name is None:
+        name = os.path.splitext(os.path.basename(record_path))[0]
+    with ChunkWriter(directory=directory, name=name, chunk_size=chunk_size) as _writer:
+        for _record in read_records(path=record_path):
+            _writer.append(samples=record_samples(record=_record))
+    return _writer.nr_samples
+
+
+# Writer of a worker process, opened by _init_worker and closed when the worker exits
+_WRITER: Optional[ChunkWriter] = None
+
+
+def _init_worker(source_path: Optional[str], segment_name: Optional[str], directory: str, name: str,
+                 chunk_size: int) -> Optional[multiprocessing.util.Finalize]:
+    global _WRITER
+    SelfPlay._init_worker(source_path=source_path, segment_name=segment_name)
+    # Named after the process, so every worker appends to chunk files of its own
+    _WRITER = ChunkWriter(directory=directory, name=f'{name}-{os.getpid()}', chunk_size=chunk_size)
+    # Pool workers run finalizers with an exit priority when they exit after Pool.close
+    return multiprocessing.util.Finalize(_WRITER, _WRITER.close, exitpriority=0)
+
+
+def _export_seed(args) -> int:
+    _summary = SelfPlay._play_seed(args)
+    _samples = record_samples(record=_summary.record)
+    _WRITER.append(samples=_samples)
+    return len(_samples)
+
+
+def export_self_play(seeds: Sequence[int],
+                     directory: str = TRAINING_DATA_PATH,
+                     strategies: Sequence[str] = ("greedy", "greedy"),
+                     nr_processes: int = None,
+                     source_path: str = None,
+                     share_memory: bool = False,
+                     chunk_size: int = CHUNK_SIZE) -> int:
+    """ Plays one game per seed across a pool of worker processes (set up as in run_self_play).
+        Every worker appends the samples of its games as they finish to one ChunkWriter named
+        'seeds-<first>-<last>-<pid>', so export overlaps with play and only the last chunk of a
+        worker is partly filled. Returns the number of samples. """
+    for _strategy in strategies:
+        assert _strategy in STRATEGIES, f'Unknown strategy: {_strategy}, choose from {list(STRATEGIES)}.'
+    _seeds = list(seeds)
+    if not _seeds:
+        return 0
+    if nr_processes is None:
+        nr_processes = multiprocessing.cpu_count()
+    # Compiling the lexicon cache once up front instead of in every worker
+    _dictionary = get_lexicon(source_path=source_path)
+    _tasks = [(_seed, tuple(strategies), True) for _seed in _seeds]
+    _initargs = (source_path, None, directory, f'seeds-{_seeds[0]}-{_seeds[-1]}', chunk_size)
+
+    if nr_processes == 1:
+        _finalizer = _init_worker(*_initargs)
+        try:
+            return sum(map(_export_seed, _tasks))
+        finally:
+            _finalizer()
+    _segment = share_lexicon(dictionary=_dictionary) if share_memory else None
+    try:
+        _pool = multiprocessing.Pool(processes=nr_processes, initializer=_init_worker,
+                                     initargs=(source_path, _segment.name if _segment else None) + _initargs[2:])
+        try:
+            _nr_samples = sum(_pool.imap_unordered(_export_seed, _tasks))
+            # Letting the workers exit on their own, so their writers finish the last chunks
+            _pool.close()
+        except BaseException:
+            _pool.terminate()
+            raise
+        finally:
+            _pool.join()
+        return _nr_samples
+    finally:
+        if _segment is not None:
+            _segment.close()
+            _segment.unlink()
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description="Exports (position, move, score, outcome) samples of games.")
+    _parser.add_argument("--output", default=TRAINING_DATA_PATH, help="Dataset directory.")
+    _parser.add_argument("--from-records", default=None,
+                         help="Export the games of this record file instead of playing new ones.")
+    _parser.add_argument("--games", type=int, default=1000, help="Number of self-play games.")
+    _parser.add_argument("--seed", type=int, default=0, help="Seed of the first game, games use consecutive seeds.")
+    _parser.add_argument("--processes", type=int, default=None, help="Worker processes, one per core by default.")
+    _parser.add_argument("--players", nargs=2, default=["greedy", "greedy"], choices=list(STRATEGIES),
+                         help="Strategy of each player.")
+    _parser.add_argument("--shared-memory", action="store_true",
+                         help="Share the lexicon with the workers through shared memory instead of the cache file.")
+    _parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Samples per chunk file.")
+    _args = _parser.parse_args()
+
+    _start = time.perf_counter()
+    if _args.from_records:
+        _nr_samples = export_records(record_path=_args.from_records, directory=_args.output,
+                                     chunk_size=_args.chunk_size)
+    else:
+        _nr_samples = export_self_play(seeds=range(_args.seed, _args.seed + _args.games), directory=_args.output,
+                                       strategies=_args.players, nr_processes=_args.processes,
+                                       share_memory=_args.shared_memory, chunk_size=_args.chunk_size)
+    _duration = time.perf_counter() - _start
+    _dataset = TrainingDataset(directory=_args.output)
+    print(f'{_nr_samples} samples in {_duration:.1f}s ({_nr_samples / _duration:.0f}/s), '
+          f'dataset holds {len(_dataset)} samples in {len(_dataset.chunks)} chunks')
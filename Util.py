@@ -1,9 +1,10 @@
 import os
-from itertools import combinations, permutations
+import weakref
 
 import pygame
 
 from GameObjects import *
+from Lexicon import *
 
 
 def draw_rect(surface: pygame.Surface, color: Tuple[int, int, int], rect: pygame.Rect, border: int = None,
@@ -51,6 +52,21 @@ def draw_text(surface: pygame.Surface, cells: np.ndarray) -> None:
                              cells[_cell].score.text_rect)
 
 
+def draw_cell(surface: pygame.Surface, cell: Cell, border: int) -> None:
+    """ Draws a single board or hand cell with its multiplier, letter and score text. """
+    draw_rect(surface=surface,
+              color=cell.button.get_color(),
+              rect=cell.button.rect,
+              border=border,
+              border_color=cell.edge_color)
+    if cell.is_multiplier():
+        surface.blit(cell.multiplier.text_surface, cell.multiplier.text_rect)
+    if cell.is_occupied():
+        surface.blit(cell.content.text_surface, cell.content.text_rect)
+    if cell.is_score():
+        surface.blit(cell.score.text_surface, cell.score.text_rect)
+
+
 def draw_button(surface: pygame.Surface, button: Union[PygameButton, LabeledTile]) -> None:
     # Button rectangle
     pygame.draw.rect(surface=surface,
@@ -64,8 +80,9 @@ def draw_tile(surface: pygame.Surface, tile: LabeledTile) -> None:
     draw_button(surface=surface, button=tile)
 
 
-def transfer_letter(hand_cell: Cell, board_cell: Cell) -> None:
-    """ Wrapper function for setting pygame text object in board cell. """
+def transfer_letter(hand_cell: Cell, board_cell: Cell) -> bool:
+    """ Wrapper function for setting pygame text object in board cell,
+        returns whether the letter was moved. """
     if hand_cell.is_occupied() and not board_cell.is_occupied():
         pygame_letter = PygameText(text=hand_cell.content.text,
                                    text_size=board_cell.text_size,
@@ -83,6 +100,8 @@ def transfer_letter(hand_cell: Cell, board_cell: Cell) -> None:
         hand_cell.remove_score()
         if board_cell.is_multiplier():
             board_cell.remove_multiplier()
+        return True
+    return False
 
 
 def update_hand_contents(hand: Hand) -> None:
@@ -104,27 +123,34 @@ def get_wordlist():
     CURRENT_DIR = os.getcwd()
     WORDLIST_DIR = CURRENT_DIR + "/Algorithm/word lists/"
     WORDLIST = os.listdir(WORDLIST_DIR)[0]
-    _word_list = np.loadtxt(fname=WORDLIST_DIR + WORDLIST, dtype=str, skiprows=2).tolist()
+    _word_list = read_wordlist(path=WORDLIST_DIR + WORDLIST)
     return _word_list
 
 
-def words_in_dictionary(_string: str, dictionary: Trie) -> List[Tuple[str, int]]:
-    """ Takes all possible subsets of string of size at least 2,
-        finds all permutation of each of these, searches the dictionary
-        and returns a list containing (word, word_score). """
+# Anagram index of each dictionary, built on first use
+_ANAGRAM_INDICES = weakref.WeakKeyDictionary()
+
+
+def get_anagram_index(dictionary: DAWG, max_length: int) -> AnagramIndex:
+    """ Anagram index over the words of at most 'max_length' letters in dictionary. """
+    _indexed_length, _index = _ANAGRAM_INDICES.get(dictionary, (0, None))
+    if _indexed_length < max_length:
+        _index = AnagramIndex(words=dictionary.words(max_length=max_length))
+        _ANAGRAM_INDICES[dictionary] = (max_length, _index)
+    return _index
+
 
-    def word_score(_word: str) -> int:
-        return sum([POINT_DISTRIBUTION[letter] for letter in _word])
+def words_in_dictionary(_string: str, dictionary: DAWG) -> List[Tuple[str, int]]:
+    """ Finds all words of at least 2 letters that can be spelled from the letters
+        of string (" " being a blank worth 0 points) and returns a list
+        containing (word, word_score). """
 
-    # Getting alle possible k-sized (at least k=2) permutations of string.
-    all_unique_perms = []
-    for _word_length in range(2, len(_string) + 1):
-        combs = list(combinations(_string, r=_word_length))
-        unique_perms = []
-        for comb in combs:
-            if comb not in unique_perms:
-                unique_perms += ["".join(t) for t in list(permutations("".join(comb)))]
-        all_unique_perms += unique_perms
+    def word_score(_word: str, _blank_letters: str) -> int:
+        return sum([POINT_DISTRIBUTION[letter] for letter in _word]) - \
+            sum([POINT_DISTRIBUTION[letter] for letter in _blank_letters])
 
-    # Getting the words that are in dictionary
-    return [(_str, word_score(_str)) for _str in all_unique_perms if dictionary.holds(word=_str)]
+    # One walk over the sub-multisets of the string in the anagram index
+    _index = get_anagram_index(dictionary=dictionary, max_length=max(HAND_SIZE, len(_string)))
+    _words = [(_word, word_score(_word, _blank_letters))
+              for _word, _blank_letters in _index.anagrams(rack=_string, min_length=2)]
+    return sorted(_words, key=lambda _entry: (len(_entry[0]), _entry[0]))
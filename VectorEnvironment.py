@@ -0,0 +1,155 @@
+import random
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from Engine import *
+from Lexicon import *
+from SelfPlay import *
+
+
+def game_observation(game: Game) -> Dict[str, np.ndarray]:
+    """ Arrays describing a game from the view of the player in turn: board letter codes
+        (see Settings.EMPTY), blank flags and uncovered premiums (see Scoring.PREMIUM_CODES),
+        rack letter counts (blanks last), scores, number of tiles in the bag and the player in turn. """
+    return {"letters": game.board.letters.copy(),
+            "blanks": game.board.blanks.copy(),
+            "premiums": game.board.premiums.copy(),
+            "rack": np.array(rack_counts(game.current_rack.letters), dtype=np.uint8),
+            "scores": np.array(game.scores, dtype=np.int32),
+            "bag_size": np.array(len(game.bag), dtype=np.int16),
+            "current_player": np.array(game.current_player, dtype=np.int8)}
+
+
+class VectorEnvironment:
+    """ Batch of independent two player games with a Gym style reset/step interface.
+
+    The agent chooses among the top_k highest scoring legal moves of each game, action top_k
+    being a pass. Observations, candidate moves, legal action masks and rewards are stacked
+    arrays over the batch, written in place into buffers that are reused between steps.
+    With an opponent strategy (see SelfPlay.STRATEGIES) the agent plays player 0 and the
+    opponent answers every agent move, otherwise the agent plays both seats. The reward is the
+    change in the acting player's score margin. Finished games are reset with a fresh seed and
+    the observation returned for them is the first of the new game. """
+
+    def __init__(self, nr_envs: int,
+                 seed: int = 0,
+                 top_k: int = 64,
+                 opponent: Optional[str] = "greedy",
+                 dictionary: DAWG = None) -> None:
+        assert opponent is None or opponent in STRATEGIES, \
+            f'Unknown opponent: {opponent}, choose from {list(STRATEGIES)}.'
+        self.nr_envs = nr_envs
+        self.top_k = top_k
+        self.pass_action = top_k
+        self.opponent = opponent
+        self.dictionary = dictionary if dictionary is not None else get_lexicon()
+        self._next_seed = seed
+        self._rng = random.Random(f'{seed}-opponent')
+        self.games: List[Optional[Game]] = [None] * nr_envs
+        self._candidates: List[List[Move]] = [[] for _ in range(nr_envs)]
+
+        _size = BoardState().size
+        self.letters = np.zeros(shape=(nr_envs, _size, _size), dtype=np.uint8)
+        self.blanks = np.zeros(shape=(nr_envs, _size, _size), dtype=bool)
+        self.premiums = np.zeros(shape=(nr_envs, _size, _size), dtype=np.uint8)
+        self.racks = np.zeros(shape=(nr_envs, len(ALPHABET)), dtype=np.uint8)
+        self.scores = np.zeros(shape=(nr_envs, 2), dtype=np.int32)
+        self.bag_sizes = np.zeros(shape=nr_envs, dtype=np.int16)
+        self.current_players = np.zeros(shape=nr_envs, dtype=np.int8)
+        # (row, col, letter code) of the tiles of each candidate move, -1 padded; blanks as negative codes
+        self.action_tiles = np.full(shape=(nr_envs, top_k, HAND_SIZE, 3), fill_value=-1, dtype=np.int8)
+        self.action_scores = np.zeros(shape=(nr_envs, top_k), dtype=np.int32)
+        self.action_mask = np.zeros(shape=(nr_envs, top_k + 1), dtype=bool)
+        self.rewards = np.zeros(shape=nr_envs, dtype=np.float32)
+        self.dones = np.zeros(shape=nr_envs, dtype=bool)
+
+    def _observations(self) -> Dict[str, np.ndarray]:
+        return {"letters": self.letters,
+                "blanks": self.blanks,
+                "premiums": self.premiums,
+                "rack": self.racks,
+                "scores": self.scores,
+                "bag_size": self.bag_sizes,
+                "current_player": self.current_players,
+                "action_tiles": self.action_tiles,
+                "action_scores": self.action_scores,
+                "action_mask": self.action_mask}
+
+    def _new_game(self, index: int) -> None:
+        self.games[index] = Game(dictionary=self.dictionary, seed=self._next_seed)
+        self._next_seed += 1
+
+    def _write_observation(self, index: int) -> None:
+        _game = self.games[index]
+        self.letters[index] = _game.board.letters
+        self.blanks[index] = _game.board.blanks
+        self.premiums[index] = _game.board.premiums
+        self.racks[index] = rack_counts(_game.current_rack.letters)
+        self.scores[index] = _game.scores
+        self.bag_sizes[index] = len(_game.bag)
+        self.current_players[index] = _game.current_player
+
+        # Candidate moves ranked by score
+        _moves = _game.legal_moves()
+        _scores = _game.score_moves(moves=_moves)
+        _order = np.argsort(-_scores, kind="stable")[:self.top_k]
+        self._candidates[index] = [_moves[_i] for _i in _order]
+        self.action_tiles[index] = -1
+        self.action_scores[index] = 0
+        self.action_mask[index] = False
+        for _k, _i in enumerate(_order):
+            for _t, (_row, _col, _letter) in enumerate(_moves[_i].tiles):
+                _code = LETTER_INDEX[_letter.upper()] + 1
+                self.action_tiles[index, _k, _t] = (_row, _col, -_code if _letter.islower() else _code)
+            self.action_scores[index, _k] = _scores[_i]
+        self.action_mask[index, :len(_order)] = True
+        self.action_mask[index, self.pass_action] = True
+
+    def _margin(self, index: int, player: int) -> int:
+        _scores = self.games[index].scores
+        return _scores[player] - _scores[1 - player]
+
+    def _play_opponent(self, index: int) -> None:
+        _game = self.games[index]
+        while not _game.is_over and _game.current_player != 0:
+            _moves = _game.legal_moves()
+            _move = STRATEGIES[self.opponent](_game, _moves, _game.score_moves(moves=_moves), self._rng)
+            if _move is None:
+                _game.pass_turn()
+            else:
+                _game.play_move(move=_move)
+
+    def reset(self) -> Dict[str, np.ndarray]:
+        """ Starts new games in every slot and returns the stacked observations. """
+        for _index in range(self.nr_envs):
+            self._new_game(index=_index)
+            self._write_observation(index=_index)
+        self.rewards[:] = 0
+        self.dones[:] = False
+        return self._observations()
+
+    def step(self, actions: np.ndarray) -> Tuple[Dict[str, np.ndarray], np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        """ Applies one action per game and returns (observations, rewards, dones, infos); infos
+            holds the final scores of the games that ended in this step (zeros elsewhere). """
+        assert len(actions) == self.nr_envs, f'Expected {self.nr_envs} actions, got {len(actions)}.'
+        _final_scores = np.zeros(shape=(self.nr_envs, 2), dtype=np.int32)
+        for _index, _action in enumerate(actions):
+            _action = int(_action)
+            assert self.action_mask[_index, _action], f'Action {_action} is not legal in game {_index}.'
+            _game = self.games[_index]
+            _player = _game.current_player
+            _before = self._margin(index=_index, player=_player)
+            if _action == self.pass_action:
+                _game.pass_turn()
+            else:
+                _game.play_move(move=self._candidates[_index][_action])
+            if self.opponent is not None:
+                self._play_opponent(index=_index)
+            self.rewards[_index] = self._margin(index=_index, player=_player) - _before
+            self.dones[_index] = _game.is_over
+            if _game.is_over:
+                _final_scores[_index] = _game.scores
+                self._new_game(index=_index)
+            self._write_observation(index=_index)
+        return self._observations(), self.rewards, self.dones, {"final_scores": _final_scores}
@@ -0,0 +1,47 @@
+from typing import Sequence
+
+import numpy as np
+
+from Settings import *
+
+MAX_PLAYERS = 4
+_MAX_SCORELESS_TURNS = 6  # See Engine.Game.MAX_SCORELESS_TURNS
+_MAX_BAG_COUNT = sum(LETTER_DISTRIBUTION.values())  # Bags hold at most the tiles of the default distribution
+
+# 64 bit keys drawn from a fixed seed, so hashes are equal across processes, runs and platforms
+_KEYS = np.random.default_rng(0x5C4A88)
+# [row][col][code], codes 1..26 for letters A..Z, 27..52 for blanks played as A..Z and 0 for a blank
+# not designated yet (only while placing letters in the GUI)
+SQUARE_KEYS = _KEYS.integers(0, 2 ** 64, size=(BOARD_SIZE, BOARD_SIZE, 2 * 26 + 1), dtype=np.uint64).tolist()
+# [player][ALPHABET index][n], the key of the n-th copy of a letter on a player's rack
+RACK_KEYS = _KEYS.integers(0, 2 ** 64, size=(MAX_PLAYERS, len(ALPHABET), HAND_SIZE), dtype=np.uint64).tolist()
+# [ALPHABET index][count], the key of the number of tiles of a letter left in the bag
+BAG_KEYS = _KEYS.integers(0, 2 ** 64, size=(len(ALPHABET), _MAX_BAG_COUNT + 1), dtype=np.uint64).tolist()
+PLAYER_KEYS = _KEYS.integers(0, 2 ** 64, size=MAX_PLAYERS, dtype=np.uint64).tolist()  # Player in turn
+SCORELESS_KEYS = _KEYS.integers(0, 2 ** 64, size=_MAX_SCORELESS_TURNS + 1, dtype=np.uint64).tolist()
+
+
+def square_key(row: int, col: int, letter: str) -> int:
+    """ Key of a tile on square (row, col), lower case letters being blanks. """
+    if letter == " ":
+        return SQUARE_KEYS[row][col][0]
+    return SQUARE_KEYS[row][col][LETTER_INDEX[letter.upper()] + 1 + (26 if letter.islower() else 0)]
+
+
+def rack_hash(letters: Sequence[str], player: int = 0) -> int:
+    """ Hash of the multiset of tiles on a rack, " " being a blank. """
+    _hash = 0
+    _seen = [0] * len(ALPHABET)
+    for _letter in letters:
+        _index = LETTER_INDEX[_letter]
+        _hash ^= RACK_KEYS[player][_index][_seen[_index]]
+        _seen[_index] += 1
+    return _hash
+
+
+def bag_hash(counts: Sequence[int]) -> int:
+    """ Hash of the number of tiles of each ALPHABET letter in a bag. """
+    _hash = 0
+    for _index, _count in enumerate(counts):
+        _hash ^= BAG_KEYS[_index][_count]
+    return _hash
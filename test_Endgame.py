@@ -0,0 +1,60 @@
+import numpy as np
+
+from Endgame import *
+from Lexicon import *
+
+
+def _minimax(board: BoardState, racks: List[List[str]], player: int, nr_scoreless: int,
+             generator: MoveGenerator) -> int:
+    """ Spread the player in turn gains until the end of the game, every line played out. """
+    _rack, _opponent_rack = racks[player], racks[1 - player]
+    _moves = generator.generate(letters=board.letters, rack=_rack, cross_checks=board.cross_checks)
+    _scores = score_moves(letters=board.letters, blanks=board.blanks, moves=_moves).tolist() if _moves else []
+    _best = None
+    for _move, _score in list(zip(_moves, _scores)) + [(None, 0)]:
+        _played = [_letter for _, _, _letter in _move.tiles] if _move is not None else []
+        _scoreless = 0 if _score > 0 else nr_scoreless + 1
+        if _move is not None and len(_played) == len(_rack):
+            _value = _score + 2 * sum([TILE_POINTS[_letter] for _letter in _opponent_rack])
+        elif _scoreless >= Game.MAX_SCORELESS_TURNS:
+            _value = _score + sum([TILE_POINTS[_letter] for _letter in _opponent_rack]) - \
+                (sum([TILE_POINTS[_letter] for _letter in _rack]) - sum([TILE_POINTS[_letter] for _letter in _played]))
+        else:
+            _board, _racks = board.copy(), [list(_rack) for _rack in racks]
+            if _move is not None:
+                _board.place(tiles=list(_move.tiles), dictionary=generator.dictionary)
+                for _letter in _played:
+                    _racks[player].remove(" " if _letter.islower() else _letter)
+            _value = _score - _minimax(board=_board, racks=_racks, player=1 - player, nr_scoreless=_scoreless,
+                                       generator=generator)
+        _best = _value if _best is None else max(_best, _value)
+    return _best
+
+
+def _endgame(seed: int, dictionary: DAWG, max_tiles: int) -> Optional[Game]:
+    """ Greedy game of seed played until the bag is empty and the racks hold at most max_tiles. """
+    _game = Game(dictionary=dictionary, seed=seed)
+    while not _game.is_over and (len(_game.bag) > 0 or sum([len(_rack) for _rack in _game.racks]) > max_tiles):
+        _moves = _game.legal_moves()
+        if not _moves:
+            _game.pass_turn()
+            continue
+        _game.play_move(move=_moves[int(np.argmax(_game.score_moves(moves=_moves)))])
+    return None if _game.is_over else _game
+
+
+def test_solve_matches_minimax_on_small_racks() -> None:
+    _dictionary = get_lexicon()
+    _generator, _solver = MoveGenerator(dictionary=_dictionary), EndgameSolver(dictionary=_dictionary)
+    _nr_solved = 0
+    for _seed in range(8):
+        _game = _endgame(seed=_seed, dictionary=_dictionary, max_tiles=3)
+        if _game is None:
+            continue
+        _result = _solver.solve(game=_game, time_budget=60.0)
+        assert _result.complete, f'Endgame of seed {_seed} was not searched to the end.'
+        _racks = [list(_game.current_rack.letters), list(_game.racks[1 - _game.current_player].letters)]
+        assert _result.value == _minimax(board=_game.board.copy(), racks=_racks, player=0,
+                                         nr_scoreless=_game.nr_scoreless_turns, generator=_generator), _seed
+        _nr_solved += 1
+    assert _nr_solved >= 4
@@ -0,0 +1,27 @@
+import os
+
+from GameRecords import *
+
+
+def _record(seed: int) -> GameRecord:
+    _turns = [Turn(player=0, rack=tuple("CAT ERS"), kind=TURN_PLAY, tiles=((7, 6, "C"), (7, 7, "A"), (7, 8, "t")),
+                   exchanged=(), score=8 + seed),
+              Turn(player=1, rack=tuple("QQVWXYZ"), kind=TURN_EXCHANGE, tiles=(), exchanged=("Q", "V"), score=0),
+              Turn(player=0, rack=tuple("ERSDOGE"), kind=TURN_PASS, tiles=(), exchanged=(), score=0)]
+    return GameRecord(seed=seed, turns=_turns, final_racks=[tuple("ERSDOGE"), tuple("QQWXYZE")],
+                      scores=[8 + seed, 0])
+
+
+def test_append_after_truncated_record(tmp_path) -> None:
+    _path = str(tmp_path / "games.bin")
+    with GameRecordWriter(path=_path) as _writer:
+        for _seed in range(2):
+            _writer.write(record=_record(seed=_seed))
+    # An interrupted writer leaves the second record cut off
+    with open(_path, "r+b") as _file:
+        _file.truncate(os.path.getsize(_path) - 10)
+    with GameRecordWriter(path=_path) as _writer:
+        for _seed in range(2, 4):
+            _writer.write(record=_record(seed=_seed))
+
+    assert list(read_records(path=_path)) == [_record(seed=_seed) for _seed in (0, 2, 3)]
@@ -0,0 +1,33 @@
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from ScrabbleEnvironment import *
+
+
+def _place(scrabble: Scrabble, tiles) -> None:
+    """ Clicks the hand letter and then the board square of every tile. """
+    for _row, _col, _letter in tiles:
+        _slot = next(_i for _i, _cell in enumerate(scrabble.hand.letter_cells)
+                     if _cell.is_occupied() and _cell.content.text == _letter)
+        scrabble._press(element=("hand", _slot, scrabble.hand.letter_cells[_slot].button))
+        scrabble._press(element=("board", (_row, _col), scrabble.board.grid[_row][_col].button))
+
+
+def test_letter_dropped_on_tile_stays_in_hand() -> None:
+    pygame.init()
+    _scrabble = Scrabble(seed=0, display_gameplay=False)
+    _move = next(_move for _move in _scrabble.game.legal_moves() if not any(_l.islower() for *_, _l in _move.tiles))
+    _place(scrabble=_scrabble, tiles=_move.tiles)
+    _scrabble._press(element=("button", _scrabble.submit_button, _scrabble.submit_button))
+    assert _scrabble.game.board.nr_tiles == len(_move.tiles)
+
+    # Dropping a letter of the next rack on a committed tile, then clearing the play
+    _row, _col, _ = _move.tiles[0]
+    _place(scrabble=_scrabble, tiles=[(_row, _col, _scrabble.hand.letters[0])])
+    assert _scrabble.play.board_coordinates == []
+    _scrabble._press(element=("button", _scrabble.clear_button, _scrabble.clear_button))
+
+    assert _scrabble.board.grid[_row][_col].is_occupied()
+    assert sorted(_scrabble.hand.letters) == sorted(_scrabble.game.current_rack.letters)
+    assert _scrabble.board.pending_hash == 0 and _scrabble.board.hash == _scrabble.game.board.hash